@@ -0,0 +1,211 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+# pygame prints a hello line on import, that would end up in the middle of the JSON on stdout
+os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = '1'
+import pygame
+
+from main import Game
+from scripts.backend import BACKENDS
+from scripts.clouds import Clouds
+from scripts.draw_queue import LAYER_NAMES
+from scripts.headless import ScriptedInput
+from scripts.profiler import FrameProfiler, NullProfiler
+from scripts.tilemap import Tilemap
+
+# run the game without a window for a fixed number of frames per scenario and print how long every subsystem took,
+# as JSON so two runs (two versions of the game) can be compared by a script
+# run it from the folder PlatformerV2 is in, like main.py, that's where the maps and images are found from
+# usage: python PlatformerV2/benchmark.py [--scenario map0 --scenario leaf_storm ...] [--frames 600] [--output out.json]
+
+
+# a level in map_dir that's only there for the benchmark: a long floor with platforms and lots of enemies on them
+def write_enemy_map(map_dir, enemies=300, width=400):
+    tilemap = Tilemap(SimpleNamespace(assets={}))
+    for x in range(width):
+        for y in range(20, 23):
+            tilemap.set_tile((x, y), 'stone', 0)
+    # platforms every 12 tiles, alternating between two heights
+    for start in range(0, width - 6, 12):
+        y = 15 if (start // 12) % 2 else 11
+        for x in range(start, start + 6):
+            tilemap.set_tile((x, y), 'grass', 0)
+    # walls at both ends, so nobody walks off the map
+    for y in range(0, 20):
+        tilemap.set_tile((-1, y), 'stone', 0)
+        tilemap.set_tile((width, y), 'stone', 0)
+    tilemap.autotile()
+
+    tilemap.add_offgrid({'type': 'spawners', 'variant': 0, 'pos': [48, 20 * 16 - 16]})
+    rng = random.Random(1)
+    for i in range(enemies):
+        tilemap.add_offgrid({'type': 'spawners', 'variant': 1,
+                             'pos': [rng.uniform(64, width * 16 - 32), rng.uniform(0, 8 * 16)]})
+    tilemap.save(os.path.join(map_dir, '0.json'))
+
+
+def start_level(game, level):
+    game.level = level
+    game.load_level(level)
+
+
+# the death particles of a dying enemy, several times a second, all around the camera
+def death_storm(game, frame, rng):
+    if frame % 4 == 0:
+        for i in range(3):
+            game.death_burst((game.scroll[0] + rng.random() * game.display.get_width(),
+                              game.scroll[1] + rng.random() * game.display.get_height()))
+
+
+# hundreds of trees worth of leaf spawners around where the player starts
+def leaf_storm(game, rng, spawners=400):
+    center = game.player.rect().center
+    for i in range(spawners):
+        game.leaf_spawners.append(pygame.Rect(center[0] + rng.uniform(-320, 320), center[1] + rng.uniform(-240, 120),
+                                              23, 13))
+
+
+# a sky with hundreds of clouds instead of 16
+def cloudy(game, rng, count=400):
+    game.clouds = Clouds(game.assets['clouds'], count=count)
+
+
+# name -> (setup(game, rng), every_frame(game, frame, rng) or None, makes its own map)
+SCENARIOS = {
+    'map0': (lambda game, rng: start_level(game, 0), None, False),
+    'map1': (lambda game, rng: start_level(game, 1), None, False),
+    'map2': (lambda game, rng: start_level(game, 2), None, False),
+    'many_enemies': (lambda game, rng: None, None, True),
+    'death_storm': (lambda game, rng: None, death_storm, False),
+    'leaf_storm': (leaf_storm, None, False),
+    'cloudy': (cloudy, None, False),
+}
+
+
+def run_scenario(name, frames, warmup, seed, batched_physics, backend='surface'):
+    setup, every_frame, own_map = SCENARIOS[name]
+    # the same seed always plays out the same game: same clouds, same enemy decisions, same input
+    random.seed(seed)
+    rng = random.Random(seed)
+    script = ScriptedInput.random(warmup + frames, seed=seed)
+
+    map_dir = tempfile.TemporaryDirectory() if own_map else None
+    if map_dir is not None:
+        write_enemy_map(map_dir.name)
+        game = Game(batched_physics=batched_physics, headless=True, map_dir=map_dir.name + '/', backend=backend)
+    else:
+        game = Game(batched_physics=batched_physics, headless=True, backend=backend)
+    setup(game, rng)
+
+    profiler = FrameProfiler()
+    frame_section = profiler.section('frame')
+    # images drawn per layer, over all measured frames
+    draws = [0] * len(LAYER_NAMES)
+    # objects the camera let through and skipped, over all measured frames
+    drawn = culled = 0
+    done = 0
+    start = 0
+    for frame in range(warmup + frames):
+        # the first warmup frames aren't measured, they fill the caches (baked chunks, collision meshes, ...)
+        if frame == warmup:
+            game.profiler = profiler
+            start = time.perf_counter()
+        with frame_section:
+            if every_frame is not None:
+                every_frame(game, frame, rng)
+            if not game.update():
+                break
+            game.render()
+            for event in script(frame):
+                game.handle_event(event)
+        if frame >= warmup:
+            profiler.end_frame()
+            draws = [total + count for total, count in zip(draws, game.shown_draws)]
+            drawn += game.shown_drawn
+            culled += game.shown_culled
+            done += 1
+    elapsed = time.perf_counter() - start if done else 0
+    game.profiler = NullProfiler()
+    game.tilemap.clear()
+    if map_dir is not None:
+        map_dir.cleanup()
+
+    return {
+        'frames': done,
+        'seconds': elapsed,
+        'fps': done / elapsed if elapsed else 0,
+        'level': game.level,
+        'enemies_left': len(game.enemies),
+        'subsystems': profiler.summary(),
+        # images the draw queue drew per frame, by layer
+        'draws': {name: total / done if done else 0 for name, total in zip(LAYER_NAMES, draws)},
+        # enemies, projectiles, sparks and particles per frame that were on screen and that were skipped
+        'culling': {'drawn': drawn / done if done else 0, 'culled': culled / done if done else 0},
+    }
+
+
+# how long Game() takes to start, in milliseconds (the best of repeats tries)
+def measure_startup(repeats=5):
+    times = []
+    for i in range(repeats):
+        game = Game(headless=True)
+        times.append(game.startup_time * 1000)
+        game.tilemap.clear()
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Ninja Game benchmark')
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                        help='scenario to run, can be given more than once (all of them if not given)')
+    parser.add_argument('--frames', type=int, default=600, help='measured frames per scenario')
+    parser.add_argument('--warmup', type=int, default=60, help='frames to run before measuring')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--batched-physics', action='store_true')
+    parser.add_argument('--backend', choices=list(BACKENDS), default='surface',
+                        help='how frames get onto the window, the scale subsystem is the time that takes')
+    parser.add_argument('--output', help='write the JSON here instead of printing it')
+    parser.add_argument('--startup-repeats', type=int, default=5,
+                        help='how many times to start the game to measure the startup time (0: don\'t)')
+    args = parser.parse_args()
+
+    report = {
+        'python': platform.python_version(),
+        'pygame': pygame.version.ver,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'frames': args.frames,
+        'warmup': args.warmup,
+        'seed': args.seed,
+        'batched_physics': args.batched_physics,
+        'backend': args.backend,
+        # every subsystem of every scenario: milliseconds per frame, mean, max, p50, p90 and p99
+        'scenarios': {},
+    }
+    if args.startup_repeats > 0:
+        report['startup_ms'] = measure_startup(args.startup_repeats)
+    for name in args.scenario or list(SCENARIOS):
+        report['scenarios'][name] = run_scenario(name, args.frames, args.warmup, args.seed, args.batched_physics,
+                                                  args.backend)
+        print(name, 'done', file=sys.stderr)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        f = open(args.output, 'w')
+        f.write(text + '\n')
+        f.close()
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
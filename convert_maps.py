@@ -0,0 +1,16 @@
+import glob
+import os
+import sys
+from types import SimpleNamespace
+
+from scripts.tilemap import Tilemap
+
+# convert json maps to the binary map format, each .map file is written next to its .json file
+# usage: python PlatformerV2/convert_maps.py [map.json ...]   (all of data/maps when no file is given)
+for path in sys.argv[1:] or sorted(glob.glob('PlatformerV2/data/maps/*.json')):
+    # the converter never draws anything, so the tilemap doesn't need any images
+    tilemap = Tilemap(SimpleNamespace(assets={}))
+    tilemap.load(path)
+    map_path = os.path.splitext(path)[0] + '.map'
+    tilemap.save(map_path)
+    print(path, os.path.getsize(path), 'bytes ->', map_path, os.path.getsize(map_path), 'bytes')
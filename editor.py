@@ -1,29 +1,30 @@
+import argparse
 import pygame
 import sys
 from scripts.utils import load_images
+from scripts.assets import AssetRegistry
 from scripts.tilemap import Tilemap
+from scripts.backend import BACKENDS, create_backend
 
 RENDER_SCALE = 2.0
 
 
 class Editor:
     # constructor of class Game
-    def __init__(self):
+    # backend: how the display gets onto the window, one of backend.BACKENDS
+    def __init__(self, backend='surface'):
         pygame.init()  # Initialize pygame library, must init first before you can use pygame functions
-        pygame.display.set_caption('editor')  # Set title
-        self.screen = pygame.display.set_mode((640, 480))  # create game window 640p width and 480 height
         self.display = pygame.Surface((320, 240))  # Create game surface 320x240, this is where everything is drawn on
+        # create game window 640p width and 480 height titled 'editor', the backend scales the display onto it
+        self.backend = create_backend(backend, self.display.get_size(), (640, 480), 'editor')
 
         self.clock = pygame.time.Clock()  # create object Clock to limit frame rate of the game
 
-        self.assets = {
-            'decor': load_images('tiles/decor'),
-            'grass': load_images('tiles/grass'),
-            'large_decor': load_images('tiles/large_decor'),
-            'stone': load_images('tiles/stone'),
-            'spawners': load_images('tiles/spawners'),
-
-        }
+        # a tile set is only loaded once it's shown
+        self.assets = AssetRegistry()
+        for tile_type in ['decor', 'grass', 'large_decor', 'stone', 'spawners']:
+            # tile_type=tile_type, otherwise every lambda would see the last tile_type of the loop
+            self.assets.register(tile_type, lambda tile_type=tile_type: load_images('tiles/' + tile_type))
 
         self.movement = [False, False, False, False]
 
@@ -52,6 +53,8 @@ class Editor:
         self.right_clicking = False
         self.shift = False
         self.ongrid = True
+        # grid cells placed or removed since the last autotile, pressing T only autotiles around these
+        self.edited_tiles = set()
 
     def run(self):
         # infinite loop to keep the game running
@@ -98,21 +101,16 @@ class Editor:
 
             # function to place a tile using LMC base on mouse position
             if self.clicking and self.ongrid:
-                self.tilemap.tilemap[str(tile_pos[0]) + ';' + str(tile_pos[1])] = {
-                    'type': self.tile_list[self.tile_group], 'variant': self.tile_variant, 'pos': tile_pos}
+                self.tilemap.set_tile(tile_pos, self.tile_list[self.tile_group], self.tile_variant)
+                self.edited_tiles.add(tile_pos)
 
             # function to delete a tile using RMC base on mouse position
-            # tilemap.tilemap explain: .tilemap is attribute of tilemap object
             if self.right_clicking:
-                tile_loc = str(tile_pos[0]) + ';' + str(tile_pos[1])
-                if tile_loc in self.tilemap.tilemap:
-                    del self.tilemap.tilemap[tile_loc]
-                for tile in self.tilemap.offgrid_tiles.copy():
-                    tile_img = self.assets[tile['type']][tile['variant']]
-                    tile_r = pygame.Rect(tile['pos'][0] - self.scroll[0], tile['pos'][1] - self.scroll[1], tile_img.get_width(), tile_img.get_height())
-                    # if this tile is "collide" with our mouse
-                    if tile_r.collidepoint(mpos):
-                        self.tilemap.offgrid_tiles.remove(tile)
+                if self.tilemap.remove_tile(tile_pos):
+                    self.edited_tiles.add(tile_pos)
+                # ask the tilemap which off grid tiles are under the mouse (in world space) instead of testing all of them
+                for tile in self.tilemap.offgrid_at((mpos[0] + self.scroll[0], mpos[1] + self.scroll[1])):
+                    self.tilemap.remove_offgrid(tile)
 
 
             # draw the current tile we currently use on the top left of the screen
@@ -122,7 +120,8 @@ class Editor:
             pygame.Rect(*self.img_pos, *self.img.get_size())"""
             # Loop for every pygame events
             for event in pygame.event.get():
-                if event.type == pygame.QUIT:
+                # WINDOWCLOSE: with the renderer backend closing the window isn't a QUIT, its hidden window stays open
+                if event.type in (pygame.QUIT, pygame.WINDOWCLOSE):
                     pygame.quit()
                     sys.exit()
 
@@ -138,7 +137,7 @@ class Editor:
                             current window space but in the real world space that top left is actually (100, y)
                             that explain why you need to add in self.scroll[0] and [1]
                             """
-                            self.tilemap.offgrid_tiles.append(
+                            self.tilemap.add_offgrid(
                                 {'type': self.tile_list[self.tile_group], 'variant': self.tile_variant,
                                  'pos': (mpos[0] + self.scroll[0], mpos[1] + self.scroll[1])})
                     # 2 is the mouse wheel
@@ -186,8 +185,13 @@ class Editor:
                     # if press G self.ongrid will flip itself True=>False, False=>True
                     if event.key == pygame.K_g:
                         self.ongrid = not self.ongrid
+                    # T autotiles around the tiles we edited, shift + T autotiles the whole map
                     if event.key == pygame.K_t:
-                        self.tilemap.autotile()
+                        if self.shift:
+                            self.tilemap.autotile()
+                        else:
+                            self.tilemap.autotile_cells(self.edited_tiles)
+                        self.edited_tiles.clear()
                     if event.key == pygame.K_o:
                         self.tilemap.save('PlatformerV2/data/maps/0.json')
                     if event.key == pygame.K_LSHIFT:
@@ -203,11 +207,14 @@ class Editor:
                         self.movement[3] = False
                     if event.key == pygame.K_LSHIFT:
                         self.shift = False
-            # Scale the screen to a smaller display
-            self.screen.blit(pygame.transform.scale(self.display, self.screen.get_size()), (0, 0))
-            # Update the screen with every change made
-            pygame.display.update()
+            # Scale the display up to the window and show it
+            self.backend.present(self.display)
             self.clock.tick(60)
 
 
-Editor().run()
+parser = argparse.ArgumentParser(description='Ninja Game level editor')
+parser.add_argument('--backend', choices=list(BACKENDS), default='surface',
+                    help='how the frame gets onto the window: scaled with pygame (surface) or through an SDL2 '
+                         'renderer and texture (renderer, software-renderer)')
+args = parser.parse_args()
+Editor(backend=args.backend).run()
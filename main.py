@@ -1,52 +1,146 @@
+import argparse
 import os
 import random
 import math
 import time
+import numpy as np
 import pygame
 import sys
 
-from scripts.utils import load_image, load_images, Animation
+from scripts.utils import load_image, load_images, flip_image, Animation
+from scripts.atlas import Atlas
+from scripts.assets import AssetRegistry, DEFAULT_MAX_BYTES
 from scripts.entities import Player, Enemy
 from scripts.tilemap import Tilemap
 from scripts.clouds import Clouds
-from scripts.particle import Particle
-from scripts.spark import Spark
+from scripts.particle import ParticleSystem
+from scripts.spark import SparkSystem, draw_sparks
+from scripts.physics import PhysicsWorld
+from scripts.container import LiveList
+from scripts.projectile import ProjectileSystem
+from scripts.headless import ScriptedInput
+from scripts.profiler import NullProfiler
+from scripts.transitions import Transition, SHAPES
+from scripts.backend import BACKENDS, create_backend
+from scripts.camera import Camera
+from scripts.pipeline import Frame, RenderThread
+from scripts.draw_queue import (LAYER_BACKGROUND, LAYER_CLOUDS, LAYER_TILES, LAYER_ENTITIES, LAYER_PROJECTILES,
+                                LAYER_PARTICLES, LAYER_OVERLAY, LAYER_COUNT)
+
+# the folders (all of their pngs) and single images that go into the atlas: the ones every level uses
+# the tiles and the enemies are loaded one by one when a level needs them (see AssetRegistry),
+# the background is too big for the atlas
+ATLAS_ENTRIES = [
+    'clouds', 'entities/player/idle', 'entities/player/run',
+    'entities/player/jump', 'entities/player/slide', 'entities/player/wall_slide',
+    'particles/leaf', 'particles/particle',
+    'entities/player.png', 'gun.png', 'projectile.png',
+]
+
+# leaves are only spawned by trees at most this many pixels outside the screen
+LEAF_MARGIN = 128
+
+# the game updates this many times a second, whatever the frame rate is: every speed (gravity, dash, walking)
+# is in pixel per update
+UPDATE_RATE = 60
+# a frame that took longer than this (the window was dragged, a breakpoint) isn't caught up on completely
+MAX_FRAME_TIME = 0.25
+# at most this many updates in a row to catch up before a frame is drawn again, past that the game slows down
+MAX_UPDATES_PER_FRAME = 5
+# run draws at most this many frames a second by default, 0 is as many as the computer can
+DEFAULT_MAX_FPS = 120
 
 
 class Game:
     # constructor of class Game
-    def __init__(self):
+    # batched_physics: move every entity in one numpy step (PhysicsWorld) instead of one by one, and let the enemies
+    # decide and react all at once too. numpy costs about the same for 3 entities as for 300, so it only pays off
+    # with a lot of enemies: benchmark.py --scenario many_enemies (300 of them), the levels are faster without it
+    # headless: never open a window, the game is only simulated (see simulate), for tests and benchmarks
+    # map_dir: the folder the levels are loaded from, 0.json (or 0.map) is the first level
+    # asset_budget: bytes of decoded images to keep, past it the images the level doesn't use are dropped
+    # transition: the shape the next level opens up with, one of transitions.SHAPES
+    # backend: how the display gets onto the window, one of backend.BACKENDS
+    def __init__(self, batched_physics=False, headless=False, map_dir='PlatformerV2/data/maps/',
+                 asset_budget=DEFAULT_MAX_BYTES, transition='iris', backend='surface'):
+        start = time.perf_counter()
+        self.headless = headless
+        self.map_dir = map_dir
+        if headless:
+            # SDL's dummy video driver still gives us a display surface to convert() images for, but no window
+            # it has to be picked before pygame.init()
+            os.environ['SDL_VIDEODRIVER'] = 'dummy'
         pygame.init()  # Initialize pygame library, must init first before you can use pygame functions
-        pygame.display.set_caption('Ninja Game')  # Set title
-        self.screen = pygame.display.set_mode((640, 480))  # create game window 640p width and 480 height
         self.display = pygame.Surface((320, 240))  # Create game surface 320x240, this is where everything is drawn on
+        # create game window 640p width and 480 height titled 'Ninja Game', the backend scales the display onto it
+        self.backend = create_backend(backend, self.display.get_size(), (640, 480), 'Ninja Game')
 
         self.clock = pygame.time.Clock()  # create object Clock to limit frame rate of the game
 
         self.movement = [False, False]  # this variable is used to track player's movement (left or right)
-        # Create a dictionary to store all the games assets
-        self.assets = {
-            'decor': load_images('tiles/decor'),
-            'grass': load_images('tiles/grass'),
-            'large_decor': load_images('tiles/large_decor'),
-            'stone': load_images('tiles/stone'),
-            'player': load_image('entities/player.png'),
-            'background': load_image('background_glacial_mountains_lightened.png'),
-            'clouds': load_images('clouds'),
-            'enemy/idle': Animation(load_images('entities/enemy/idle'), img_dur=6),
-            'enemy/run': Animation(load_images('entities/enemy/run'), img_dur=4),
-            'player/idle': Animation(load_images('entities/player/idle'), img_dur=6),
-            'player/run': Animation(load_images('entities/player/run'), img_dur=4),
-            'player/jump': Animation(load_images('entities/player/jump')),
-            'player/slide': Animation(load_images('entities/player/slide')),
-            'player/wall_slide': Animation(load_images('entities/player/wall_slide')),
-            'particle/leaf': Animation(load_images('particles/leaf'), img_dur=20, loop=False),
-            'particle/particle': Animation(load_images('particles/particle'), img_dur=6, loop=False),
-            'gun': load_image('gun.png'),
-            'projectile': load_image('projectile.png'),
-        }
+        # the small images every level uses packed on a few big surfaces, loaded from data/atlas
+        # (and built there first if the images changed since last time)
+        atlas = Atlas.load_or_build(ATLAS_ENTRIES)
+        # all the games assets, used like a dictionary, but an entry is only loaded the first time it's used
+        # pinned entries are kept for the whole game, the others can be dropped when the level changes
+        self.assets = AssetRegistry(max_bytes=asset_budget)
+        # the tiles and the enemies are only loaded by levels that have them
+        self.assets.register('decor', lambda: load_images('tiles/decor'))
+        self.assets.register('grass', lambda: load_images('tiles/grass'))
+        self.assets.register('large_decor', lambda: load_images('tiles/large_decor'))
+        self.assets.register('stone', lambda: load_images('tiles/stone'))
+        self.assets.register('enemy/idle', lambda: Animation(load_images('entities/enemy/idle'), img_dur=6))
+        self.assets.register('enemy/run', lambda: Animation(load_images('entities/enemy/run'), img_dur=4))
+        self.assets.register('gun', lambda: atlas.image('gun.png'), pin=True)
+        # the enemies hold their gun facing left half of the time
+        self.assets.register('gun/flipped', lambda: flip_image(self.assets['gun']), pin=True)
+        self.assets.register('projectile', lambda: atlas.image('projectile.png'), pin=True)
+        self.assets.register('background', lambda: load_image('background_glacial_mountains_lightened.png'), pin=True)
+        self.assets.register('clouds', lambda: atlas.images('clouds'), pin=True)
+        self.assets.register('player', lambda: atlas.image('entities/player.png'), pin=True)
+        self.assets.register('player/idle', lambda: Animation(atlas.images('entities/player/idle'), img_dur=6), pin=True)
+        self.assets.register('player/run', lambda: Animation(atlas.images('entities/player/run'), img_dur=4), pin=True)
+        self.assets.register('player/jump', lambda: Animation(atlas.images('entities/player/jump')), pin=True)
+        self.assets.register('player/slide', lambda: Animation(atlas.images('entities/player/slide')), pin=True)
+        self.assets.register('player/wall_slide', lambda: Animation(atlas.images('entities/player/wall_slide')),
+                             pin=True)
+        self.assets.register('particle/leaf', lambda: Animation(atlas.images('particles/leaf'), img_dur=20, loop=False),
+                             pin=True)
+        self.assets.register('particle/particle',
+                             lambda: Animation(atlas.images('particles/particle'), img_dur=6, loop=False), pin=True)
 
         self.clouds = Clouds(self.assets['clouds'], count=16)
+        # every leaf and dash/death particle
+        self.particles = ParticleSystem(self, types=('leaf', 'particle'))
+        # every spark, from shooting, projectiles hitting a wall and dying
+        self.sparks = SparkSystem()
+        # the enemies and the flying projectiles of the current level
+        self.enemies = LiveList()
+        self.projectiles = ProjectileSystem()
+
+        # draw between the last two updates (see render), only run does that, it's the one drawing more often
+        # than it updates
+        self.interpolate = False
+        # the part of the level that's on screen, nothing far outside of it is drawn
+        self.camera = Camera(self.display.get_size())
+        # what render captures the frame into and then draws on the display, its queue collects the images of the
+        # frame and draws them layer by layer
+        self.frame = Frame(self.display.get_size(), self.display)
+        # the images drawn per layer and the camera's counts of the last frame shown in the window (see present),
+        # a pipelined frame can be captured into again right after it's shown, so they're copied out of it
+        self.shown_draws = [0] * LAYER_COUNT
+        self.shown_drawn = 0
+        self.shown_culled = 0
+        # draws the frames while the game updates when run is pipelined, None otherwise
+        self.render_thread = None
+        # the black overlay of the level transition
+        self.transition_effect = Transition(self.display.get_size(), shape=transition)
+
+        # measures how long every part of a frame takes, does nothing unless a benchmark swaps in a FrameProfiler
+        self.profiler = NullProfiler()
+
+        # holds the position/velocity of the player and every enemy when physics is batched, None otherwise
+        self.physics = PhysicsWorld() if batched_physics else None
 
         """ Create PhysicsEntity object represent the player,
             player's position (x=50, y=50) and size"""
@@ -61,8 +155,29 @@ class Game:
         self.picture = self.assets['background']
         self.picture = pygame.transform.scale(self.picture, (320, 240))
 
+        # seconds __init__ took, main.py --headless and the benchmark report it
+        self.startup_time = time.perf_counter() - start
+
+    # the binary .map version of a level (made by convert_maps.py) loads faster, but only use it
+    # if it's at least as new as the .json one, otherwise an edit made in the editor would be ignored
+    def map_path(self, map_id):
+        json_path = self.map_dir + str(map_id) + '.json'
+        map_path = self.map_dir + str(map_id) + '.map'
+        if os.path.exists(map_path) and (not os.path.exists(json_path)
+                                         or os.path.getmtime(map_path) >= os.path.getmtime(json_path)):
+            return map_path
+        return json_path
+
+    # a level can have both a .json and a .map file, so count the level names and not the files
+    def level_count(self):
+        return len({os.path.splitext(name)[0] for name in os.listdir(self.map_dir)})
+
     def load_level(self, map_id):
-        self.tilemap.load('PlatformerV2/data/maps/' + str(map_id) + '.json')
+        # what only the levels before used can be dropped from now on, when this one needs room for its assets
+        self.assets.new_level()
+        self.tilemap.load(self.map_path(map_id))
+        # binary maps are streamed, only the chunks around the camera are kept in memory
+        self.tilemap.start_streaming()
         self.leaf_spawners = []
         for tree in self.tilemap.extract([('large_decor', 2)], keep=True):
             # taking the position of the tile and looking for the area of the tree image that makes sense to spawn leaf
@@ -72,7 +187,7 @@ class Game:
             self.leaf_spawners.append(pygame.Rect(4 + tree['pos'][0], 4 + tree['pos'][1], 23, 13))
 
         # list of enemies
-        self.enemies = []
+        self.enemies.clear()
         # we don't want to set keep to true because we only need the location to put stuff there
         for spawner in self.tilemap.extract([('spawners', 0), ('spawners', 1)]):
             # this is the players' spawner
@@ -82,12 +197,20 @@ class Game:
                 self.player.air_time = 0
             else:
                 self.enemies.append(Enemy(self, spawner['pos'], (8, 15)))
-        self.projectiles = []
-        self.particles = []
-        self.sparks = []
+        if self.physics is not None:
+            self.physics.clear()
+            self.physics.add(self.player)
+            for enemy in self.enemies:
+                self.physics.add(enemy)
+        self.projectiles.clear()
+        self.particles.clear()
+        self.sparks.clear()
         # Scroll variable contains 2 values [scroll_x, scroll_y]
         # this variable is used to control the player's camera
         self.scroll = [0, 0]
+        # the new level starts here, don't draw anything between the old level and the new one
+        self.prev_scroll = [0, 0]
+        self.player.prev_pos = None
         # set dead 0 by default
         self.dead = 0
         # when transition level set this variable to -30
@@ -98,190 +221,370 @@ class Game:
         # 30 is when you see nothing
         self.transition = -30
 
-    def run(self):
-        # infinite loop to keep the game running
-        while True:
-            # set background, this will clear the screen every frame too
-            self.display.blit(self.picture, (0, 0))  # Change '.screen.' to display
-
-            if not len(self.enemies):
-                self.transition += 1
-                if self.transition > 30:
-                    self.level = min(self.level + 1, len(os.listdir('PlatformerV2/data/maps')))
-                    font = pygame.font.Font(None, 36)
-            
-                    # Check if the level has reached the limit
-                    if self.level == len(os.listdir('PlatformerV2/data/maps')):
-                        text = font.render("Victory!", True, (255, 255, 255))
-                    else:
-                        text = font.render("Pass!", True, (255, 255, 255))
-            
-                    screen = pygame.display.set_mode((640, 480))
-                    screen.fill((0, 0, 0))
-                    screen.blit(text, (320 - text.get_width() // 2, 240 - text.get_height() // 2))
-                    pygame.display.update()
-                    if self.level == len(os.listdir('PlatformerV2/data/maps')):
-                        time.sleep(2)
-                        break
-                    else:
-                        pygame.time.delay(1000)
-            
-                    self.load_level(self.level)
-            if self.transition < 0:
-                self.transition += 1
-
-            if self.dead:
+    # show a message in the middle of a black screen for wait milliseconds, used between levels
+    # nothing to show it on without a window, so a headless game skips it (and the wait)
+    def show_message(self, message, wait):
+        if self.headless:
+            return
+        if self.render_thread is not None:
+            # the render thread is done drawing the frames before the message, they aren't shown after it
+            self.render_thread.wait()
+            self.render_thread.take()
+        font = pygame.font.Font(None, 36)
+        text = font.render(message, True, (255, 255, 255))
+        screen = pygame.Surface(self.backend.window_size)
+        screen.blit(text, (320 - text.get_width() // 2, 240 - text.get_height() // 2))
+        self.backend.present_window(screen)
+        pygame.time.delay(wait)
+
+    # update the enemies and the player one at a time, each one moves itself (PhysicsEntity.move)
+    def update_entities(self):
+        for enemy in self.enemies:
+            kill = enemy.update(self.tilemap, (0, 0))
+            if kill:
+                self.enemies.remove(enemy)
+
+        if not self.dead:
+            # update character's movement base on input from keyboard
+            self.player.update(self.tilemap, (self.movement[1] - self.movement[0], 0))
+
+    # the batched version of updating the enemies and the player: everyone decides how to move first,
+    # then self.physics moves all of them in one step, then everyone reacts to where they ended up
+    # the enemies decide and react all at once on the world's arrays (Enemy.begin_batch, Enemy.end_batch)
+    # the player moves in that same step, so enemies check for a dash hit against where the player is this frame
+    def update_entities_batched(self):
+        player_active = not self.dead
+        # a plain list, nothing is removed from the enemies before the end
+        enemies = self.enemies.items
+        slots = np.fromiter([enemy.slot for enemy in enemies], dtype=np.int64, count=len(enemies))
+        enemy_movement = Enemy.begin_batch(self, self.physics, slots, self.tilemap)
+        self.physics.set_movements(slots, enemy_movement)
+        if player_active:
+            player_movement = self.player.begin_update(self.tilemap, (self.movement[1] - self.movement[0], 0))
+            self.physics.set_movement(self.player.slot, player_movement)
+
+        self.physics.step(self.tilemap)
+
+        killed = Enemy.end_batch(self, self.physics, enemies, slots, enemy_movement)
+        if killed:
+            killed = {id(enemy) for enemy in killed}
+            # burst in the order a loop over the enemies removing them one by one gets to them
+            for enemy in self.enemies:
+                if id(enemy) in killed:
+                    enemy.burst()
+                    self.enemies.remove(enemy)
+                    self.physics.remove(enemy)
+        if player_active:
+            self.player.end_update(self.tilemap, player_movement)
+
+    # the projectiles move, the ones hitting a wall make sparks and the ones hitting the player kill them
+    def update_projectiles(self):
+        # if the player is dashing, they'll become invincible
+        player_rect = self.player.rect() if abs(self.player.dashing) < 50 else None
+        for pos, direction, hit_player in self.projectiles.update(self.tilemap, player_rect):
+            if hit_player:
                 self.dead += 1
-                if self.dead == 10:
-                    self.transition = min(30, self.transition + 1)
-                # set a timer as soon as you die after 40 frame about 2/3 a second reload the level
-                if self.dead > 40:
-                    self.load_level(self.level)
-            """
-                self.scroll[0]:
-                self.player.rect().centerx: This gives the x-coordinate of the center of the player's sprite.
-                self.display.get_width() / 2: This gives half of the width of the display window, representing the center of the screen 
-                horizontally.
-                self.scroll[0]: This represents the current horizontal position of the camera.
-                So, (self.player.rect().centerx - self.display.get_width() / 2 - self.scroll[0]) calculates the difference between the 
-                center of the player's sprite and the center of the screen, adjusted by the current horizontal position of the camera.
-                THE SAME GOES FOR SELF.scroll[1]
-            """
-            # set camera for player
-            self.scroll[0] += (self.player.rect().centerx - self.display.get_width() / 2 - self.scroll[0]) / 30
-            self.scroll[1] += (self.player.rect().centery - self.display.get_height() / 2 - self.scroll[1]) / 30
-            # set scroll value to integer to prevent inconsistent pixel in player sprite
-            render_scroll = (int(self.scroll[0]), int(self.scroll[1]))
-
-            for rect in self.leaf_spawners:
-                # random.random() random number between 0 and 1 - floating point number -
-                # check to see if it less  than the pixel area of our rectangle
-                # control portion of leaves, big tree = more leaves, small tree = fewer leaves
-                # multiply it by 49999 to make it not every frame
-                if random.random() * 49999 < rect.width * rect.height:
-                    pos = (rect.x + random.random() * rect.width, rect.y + random.random() * rect.height)
-                    # frame=random.randint(0, 20) give it random frame to start on so that we don't always start with
-                    # the biggest leaf
-                    self.particles.append(
-                        Particle(self, 'leaf', pos, velocity=[-0.1, 0.3], frame=random.randint(0, 20)))
-
+                self.death_burst(self.player.rect().center)
+            else:
+                for i in range(4):
+                    # (math.pi if direction > 0) means
+                    # the spark shoot left only if the projectile is going right
+                    self.sparks.spawn(pos, random.random() - 0.5 + (math.pi if direction > 0 else 0), 2 + random.random())
+
+    # the sparks and particles flying out of something that died at pos
+    def death_burst(self, pos):
+        for i in range(30):
+            angle = random.random() * math.pi * 2
+            speed = random.random() * 5
+            self.sparks.spawn(pos, angle, 2 + random.random())
+            self.particles.spawn('particle', pos,
+                                 velocity=(math.cos(angle + math.pi) * speed * 0.5, math.sin(angle + math.pi) * speed * 0.5),
+                                 frame=random.randint(0, 7))
+
+    # one frame of the game without drawing anything: level transitions, camera, entities, projectiles and vfx
+    # returns False once the last level is beaten and the game is over
+    def update(self):
+        # where the camera and everyone were before this update, render can draw them between then and now
+        self.prev_scroll = list(self.scroll)
+        if self.interpolate:
+            self.player.prev_pos = (self.player.pos[0], self.player.pos[1])
+            for enemy in self.enemies:
+                enemy.prev_pos = (enemy.pos[0], enemy.pos[1])
+
+        if not len(self.enemies):
+            self.transition += 1
+            if self.transition > 30:
+                self.level = min(self.level + 1, self.level_count())
+                # Check if the level has reached the limit
+                if self.level == self.level_count():
+                    self.show_message("Victory!", 2000)
+                    return False
+                self.show_message("Pass!", 1000)
+                self.load_level(self.level)
+        if self.transition < 0:
+            self.transition += 1
+
+        if self.dead:
+            self.dead += 1
+            if self.dead == 10:
+                self.transition = min(30, self.transition + 1)
+            # set a timer as soon as you die after 40 frame about 2/3 a second reload the level
+            if self.dead > 40:
+                self.load_level(self.level)
+        """
+            self.scroll[0]:
+            self.player.rect().centerx: This gives the x-coordinate of the center of the player's sprite.
+            self.display.get_width() / 2: This gives half of the width of the display window, representing the center of the screen 
+            horizontally.
+            self.scroll[0]: This represents the current horizontal position of the camera.
+            So, (self.player.rect().centerx - self.display.get_width() / 2 - self.scroll[0]) calculates the difference between the 
+            center of the player's sprite and the center of the screen, adjusted by the current horizontal position of the camera.
+            THE SAME GOES FOR SELF.scroll[1]
+        """
+        # set camera for player
+        self.scroll[0] += (self.player.rect().centerx - self.display.get_width() / 2 - self.scroll[0]) / 30
+        self.scroll[1] += (self.player.rect().centery - self.display.get_height() / 2 - self.scroll[1]) / 30
+        self.camera.move((int(self.scroll[0]), int(self.scroll[1])))
+        # fetch the map chunks around the camera in the background and drop the far ones
+        with self.profiler.section('tilemap'):
+            self.tilemap.update_streaming((self.scroll[0] + self.display.get_width() / 2,
+                                           self.scroll[1] + self.display.get_height() / 2))
+
+        with self.profiler.section('particles'):
+            self.spawn_leaves()
+
+        with self.profiler.section('clouds'):
             self.clouds.update()
-            self.clouds.render(self.display, offset=render_scroll)
 
+        with self.profiler.section('enemies'):
+            if self.physics is not None:
+                self.update_entities_batched()
+            else:
+                self.update_entities()
+
+        with self.profiler.section('projectiles'):
+            self.update_projectiles()
+
+        with self.profiler.section('sparks'):
+            # vfx when player *dies*
+            self.sparks.update()
+
+        with self.profiler.section('particles'):
+            # moves and animates every particle, the leaves sway on their way down (see scripts/particle.py)
+            self.particles.update()
+        return True
+
+    def spawn_leaves(self):
+        # only the trees around the camera drop leaves, the leaves of a tree far away would never be seen
+        # LEAF_MARGIN is about how far a leaf falls before it's gone, so a tree above the screen still counts
+        view = self.camera.rect(LEAF_MARGIN)
+        for i in view.collidelistall(self.leaf_spawners):
+            rect = self.leaf_spawners[i]
+            # random.random() random number between 0 and 1 - floating point number -
+            # check to see if it less  than the pixel area of our rectangle
+            # control portion of leaves, big tree = more leaves, small tree = fewer leaves
+            # multiply it by 49999 to make it not every frame
+            if random.random() * 49999 < rect.width * rect.height:
+                pos = (rect.x + random.random() * rect.width, rect.y + random.random() * rect.height)
+                # frame=random.randint(0, 20) give it random frame to start on so that we don't always start with
+                # the biggest leaf
+                self.particles.spawn('leaf', pos, velocity=(-0.1, 0.3), frame=random.randint(0, 20))
+
+    # where to draw entity from, so it's drawn alpha of the way from where it was before the last update to where
+    # it is now (see render), it's the camera offset moved by the part of the last update's movement not shown yet
+    def entity_offset(self, entity, render_scroll, alpha):
+        if alpha == 1 or entity.prev_pos is None:
+            return render_scroll
+        return (render_scroll[0] - (entity.pos[0] - entity.prev_pos[0]) * (alpha - 1),
+                render_scroll[1] - (entity.pos[1] - entity.prev_pos[1]) * (alpha - 1))
+
+    # draw the current frame on the display surface and show it in the window
+    # alpha is how far the time of this frame is between the last update (0) and the next one (1): when the screen
+    # refreshes faster than the game updates, the camera and everything that moves is drawn in between
+    # the state before the last update and the state after it, so the motion is smooth. 1 is the state as it is
+    def render(self, alpha=1.0):
+        self.capture(self.frame, alpha)
+        self.draw_frame(self.frame, self.profiler)
+        self.present(self.frame)
+
+    # put everything the current state draws into frame (see Frame), without drawing anything yet
+    # it's the only part of drawing that reads the entities, particles and projectiles
+    def capture(self, frame, alpha=1.0):
+        scroll = self.scroll
+        if alpha != 1:
+            scroll = (self.prev_scroll[0] + (scroll[0] - self.prev_scroll[0]) * alpha,
+                      self.prev_scroll[1] + (scroll[1] - self.prev_scroll[1]) * alpha)
+        # set scroll value to integer to prevent inconsistent pixel in player sprite
+        render_scroll = (int(scroll[0]), int(scroll[1]))
+        # what's further than the camera's margin outside the screen isn't drawn, see Camera
+        camera = self.camera
+        camera.move(render_scroll)
+        camera.reset_counts()
+
+        # every image goes into the draw queue first, its layer says what's on top of what,
+        # then the queue draws them all with one blits call per layer
+        queue = frame.queue
+        queue.clear()
+        queue.reset_counts()
+
+        # set background, this will clear the screen every frame too
+        queue.submit(self.picture, (0, 0), LAYER_BACKGROUND)
+
+        with self.profiler.section('clouds'):
+            self.clouds.render(queue.layer(LAYER_CLOUDS), offset=render_scroll)
+
+        with self.profiler.section('tilemap'):
             # render tile map on the display surface
-            self.tilemap.render(self.display, offset=render_scroll)
+            self.tilemap.render(queue.layer(LAYER_TILES), offset=render_scroll)
 
-            for enemy in self.enemies.copy():
-                kill = enemy.update(self.tilemap, (0, 0))
-                enemy.render(self.display, offset=render_scroll)
-                if kill:
-                    self.enemies.remove(enemy)
+        with self.profiler.section('enemies'):
+            for enemy in self.enemies:
+                if camera.sees_rect(enemy.rect()):
+                    enemy.render(queue.layer(LAYER_ENTITIES), offset=self.entity_offset(enemy, render_scroll, alpha))
 
             if not self.dead:
-                # update character's movement base on input from keyboard
-                self.player.update(self.tilemap, (self.movement[1] - self.movement[0], 0))
                 # render player sprite on the display surface
-                self.player.render(self.display, offset=render_scroll)  # Change '.screen.' to display
-
-            # [[x, y], direction, timer]
-            # projectile[0][0] is the position
-            # projectile[1] is the direction
-            # and projectile[2] is the timer
-            for projectile in self.projectiles.copy():
-                projectile[0][0] += projectile[1]
-                projectile[2] += 1
-                img = self.assets['projectile']
-                # when you subtract half of the width of something that just centers it
-                self.display.blit(img, (projectile[0][0] - img.get_width() / 2 - render_scroll[0],
-                                        projectile[0][1] - img.get_height() / 2 - render_scroll[1]))
-                # if the position of projectile is a solid tile. remove the projectile
-                if self.tilemap.solid_check(projectile[0]):
-                    self.projectiles.remove(projectile)
-                    for i in range(4):
-                        # (math.pi if projectile[1] > 0) means
-                        # the spark shoot left only if the projectile is going right
-                        self.sparks.append(
-                            Spark(projectile[0], random.random() - 0.5 + (math.pi if projectile[1] > 0 else 0),
-                                  2 + random.random()))
-                # if projectile lasts longer than 360 pixels (6 seconds), remove projectile
-                elif projectile[2] > 360:
-                    self.projectiles.remove(projectile)
-                # if the player is dashing, they'll become invincible
-                elif abs(self.player.dashing) < 50:
-                    if self.player.rect().collidepoint(projectile[0]):
-                        self.projectiles.remove(projectile)
-                        self.dead += 1
-                        for i in range(30):
-                            angle = random.random() * math.pi * 2
-                            speed = random.random() * 5
-                            self.sparks.append(Spark(self.player.rect().center, angle, 2 + random.random()))
-                            self.particles.append(Particle(self, 'particle', self.player.rect().center,
-                                                           velocity=[math.cos(angle + math.pi) * speed * 0.5,
-                                                                     math.sin(angle + math.pi) * speed * 0.5],
-                                                           frame=random.randint(0, 7)))
-
-            # vfx when player *dies*
-            for spark in self.sparks.copy():
-                kill = spark.update()
-                spark.render(self.display, offset=render_scroll)
-                if kill:
-                    self.sparks.remove(spark)
-
-            # function for particle management
-            for particle in self.particles.copy():
-                kill = particle.update()
-                particle.render(self.display, offset=render_scroll)
-                if particle.type == 'leaf':
-                    # make the leaves fall naturally - fall in a sin graph
-                    # multiply by 0.035 to make it move slower
-                    # multiply by 0.3 to make the curve in sin graph smaller
-                    particle.pos[0] += math.sin(particle.animation.frame * 0.035) * 0.3
-                if kill:
-                    self.particles.remove(particle)
-
-            # print(self.tilemap.physics_rects_around(self.player.pos))
-            """Learn about this and then you can use it 
-            pygame.Rect(*self.img_pos, *self.img.get_size())"""
+                self.player.render(queue.layer(LAYER_ENTITIES), offset=self.entity_offset(self.player, render_scroll,
+                                                                                           alpha))
+
+        with self.profiler.section('projectiles'):
+            self.projectiles.render(queue.layer(LAYER_PROJECTILES), self.assets['projectile'], offset=render_scroll,
+                                    camera=camera, alpha=alpha)
+
+        with self.profiler.section('sparks'):
+            frame.sparks = self.sparks.polygons(offset=render_scroll, camera=camera, alpha=alpha)
+
+        with self.profiler.section('particles'):
+            self.particles.render(queue.layer(LAYER_PARTICLES), offset=render_scroll, camera=camera, alpha=alpha)
+
+        # if not transition yet then wait
+        # the mask of every transition step is made once (see Transition), so this is a single blit
+        with self.profiler.section('transition'):
+            self.transition_effect.render(queue.layer(LAYER_OVERLAY), self.transition)
+
+        frame.drawn = camera.drawn
+        frame.culled = camera.culled
+
+    # draw a captured frame on its surface (the display, or a surface of its own when pipelined)
+    def draw_frame(self, frame, profiler):
+        # the sparks are polygons and not images, so everything below them is drawn first
+        with profiler.section('draw'):
+            frame.queue.flush(frame.surface, LAYER_PROJECTILES)
+
+        with profiler.section('sparks'):
+            draw_sparks(frame.surface, frame.sparks)
+
+        with profiler.section('draw'):
+            frame.queue.flush(frame.surface)
+
+    # show a drawn frame in the window, always on the main thread (see RenderThread)
+    def present(self, frame):
+        with self.profiler.section('scale'):
+            # Scale the frame up to the window and show it
+            self.backend.present(frame.surface)
+        self.shown_draws = list(frame.queue.counts)
+        self.shown_drawn = frame.drawn
+        self.shown_culled = frame.culled
+
+    def handle_event(self, event):
+        # closing the window only sends WINDOWCLOSE (no QUIT) when the renderer backend's hidden window is still
+        # open, so both of them quit the game
+        if event.type in (pygame.QUIT, pygame.WINDOWCLOSE):
+            if self.render_thread is not None:
+                # pygame can't shut down under a frame that's being drawn
+                self.render_thread.stop()
+            pygame.quit()
+            sys.exit()
+        if event.type == pygame.KEYDOWN:  # Set event when pressing key down
+            if event.key == pygame.K_LEFT:
+                self.movement[0] = True
+            if event.key == pygame.K_RIGHT:
+                self.movement[1] = True
+            if event.key == pygame.K_SPACE:
+                self.player.jump()
+            if event.key == pygame.K_x:
+                self.player.dash()
+        if event.type == pygame.KEYUP:  # Set event when releasing a key
+            if event.key == pygame.K_LEFT:
+                self.movement[0] = False
+            if event.key == pygame.K_RIGHT:
+                self.movement[1] = False
+
+    # loop to keep the game running until the last level is beaten
+    # the game updates UPDATE_RATE times a second (fixed timestep) and draws as often as it can up to max_fps
+    # (0: no limit): lag is the time that passed and hasn't been updated for yet, every update takes one step off it
+    # and what's left (less than a step) is how far the frame is between two updates (alpha, see render)
+    # when the computer can't keep up, frames aren't drawn while the game catches up, so it doesn't slow down
+    # pipelined: a render thread draws each frame while the game already updates the next one (see RenderThread),
+    # a frame takes about as long as the slower of the two instead of both one after the other
+    def run(self, max_fps=DEFAULT_MAX_FPS, pipelined=False):
+        self.interpolate = True
+        frame = None
+        if pipelined:
+            # the profiler isn't made to be used from two threads, what the render thread does isn't measured
+            null_profiler = NullProfiler()
+            self.render_thread = RenderThread(lambda captured: self.draw_frame(captured, null_profiler),
+                                              self.display.get_size())
+            frame = self.render_thread.back
+            # the tile images a chunk is baked from are never blitted by both threads at once
+            self.tilemap.render_cache.before_bake = self.render_thread.wait
+        try:
+            self.run_loop(max_fps, frame)
+        finally:
+            if self.render_thread is not None:
+                self.render_thread.stop()
+                self.render_thread = None
+                self.tilemap.render_cache.before_bake = None
+
+    # the loop of run, frame is the frame to capture into when it's pipelined, None otherwise
+    def run_loop(self, max_fps, frame):
+        step = 1 / UPDATE_RATE
+        lag = step
+        previous = time.perf_counter()
+        while True:
             # Loop for every pygame events
             for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    pygame.quit()
-                    sys.exit()
-                if event.type == pygame.KEYDOWN:  # Set event when pressing key down
-                    if event.key == pygame.K_LEFT:
-                        self.movement[0] = True
-                    if event.key == pygame.K_RIGHT:
-                        self.movement[1] = True
-                    if event.key == pygame.K_SPACE:
-                        self.player.jump()
-                    if event.key == pygame.K_x:
-                        self.player.dash()
-                if event.type == pygame.KEYUP:  # Set event when releasing a key
-                    if event.key == pygame.K_LEFT:
-                        self.movement[0] = False
-                    if event.key == pygame.K_RIGHT:
-                        self.movement[1] = False
-
-            # if not transition yet then wait
-            # this code is expensive in terms of performance because you are generating another surface, draw circle
-            # and then blit it on the display
-            if self.transition:
-                # Create a black surface size of the display
-                transition_surf = pygame.Surface(self.display.get_size())
-                # the trick for transition is we draw a circle on the surface
-                # ,and then we set the color key of the surface to the color of the circle
-                # that way the circle we draw is a transparent part
-                # so when we blit the surface on top of the screen you can can't see the outer edge outside the circle
-                # * 8 is to ensure the circle can expand with proper size
-                pygame.draw.circle(transition_surf, (255, 255, 255),
-                                   (self.display.get_width() // 2, self.display.get_height() // 2), (30 - abs(self.transition) * 8))
-                transition_surf.set_colorkey((255, 255, 255))
-                self.display.blit(transition_surf, (0, 0))
-            # Scale the screen to a smaller display
-            self.screen.blit(pygame.transform.scale(self.display, self.screen.get_size()), (0, 0))
-            # Update the screen with every change made
-            pygame.display.update()
-            self.clock.tick(60)
+                self.handle_event(event)
+
+            now = time.perf_counter()
+            lag += min(now - previous, MAX_FRAME_TIME)
+            previous = now
+            updates = 0
+            while lag >= step and updates < MAX_UPDATES_PER_FRAME:
+                if not self.update():
+                    return
+                lag -= step
+                updates += 1
+            if lag >= step:
+                # still behind after the most updates we do before drawing: let that time go, the game slows down
+                lag %= step
+            if time.perf_counter() - now > MAX_FRAME_TIME:
+                # an update that waited (the message between two levels) isn't time the game has to catch up on
+                previous = time.perf_counter()
+
+            if frame is None:
+                self.render(alpha=lag / step)
+            else:
+                # the frame is captured here, between two updates, and drawn on the render thread
+                # while the loop goes on with the next updates, the newest frame it has finished is shown here
+                self.capture(frame, alpha=lag / step)
+                frame = self.render_thread.hand_off(frame)
+                drawn = self.render_thread.take()
+                if drawn is not None:
+                    self.present(drawn)
+            self.clock.tick(max_fps)
+
+    # run the game for up to frames frames as fast as possible, without drawing and without waiting for the clock
+    # the input comes from script instead of the keyboard: script(frame) returns the events of that frame
+    # (see scripts/headless.py), returns how many frames were simulated (fewer if the game was beaten before that)
+    def simulate(self, frames, script=None):
+        for frame in range(frames):
+            if not self.update():
+                return frame + 1
+            if script is not None:
+                for event in script(frame):
+                    self.handle_event(event)
+        return frames
 
 
 class StartMenu:
@@ -324,6 +627,50 @@ class StartMenu:
 
 
 def main():
+    parser = argparse.ArgumentParser(description='Ninja Game')
+    parser.add_argument('--batched-physics', action='store_true',
+                        help='move every entity in one numpy step instead of one at a time, faster with hundreds '
+                             'of enemies (benchmark.py --scenario many_enemies), slower with the few of a level')
+    parser.add_argument('--headless', action='store_true',
+                        help='no window, no menu, no frame cap: simulate --frames frames and print how long it took')
+    parser.add_argument('--frames', type=int, default=3600, help='how many frames to simulate with --headless')
+    parser.add_argument('--input', help='input script for --headless (a JSON list of [frame, action, key]), '
+                                        'random input if not given')
+    parser.add_argument('--seed', type=int, default=0, help='random seed for --headless')
+    parser.add_argument('--backend', choices=list(BACKENDS), default='surface',
+                        help='how the frame gets onto the window: scaled with pygame (surface) or through an SDL2 '
+                             'renderer and texture (renderer, software-renderer)')
+    parser.add_argument('--max-fps', type=int, default=DEFAULT_MAX_FPS,
+                        help='draw at most this many frames a second (0: no limit), the game always updates '
+                             + str(UPDATE_RATE) + ' times a second')
+    parser.add_argument('--pipelined', action='store_true',
+                        help='draw every frame on a render thread while the game updates the next one')
+    parser.add_argument('--transition', choices=sorted(SHAPES), default='iris',
+                        help='the shape of the level transition')
+    parser.add_argument('--asset-budget', type=float, default=DEFAULT_MAX_BYTES / (1024 * 1024),
+                        help='megabytes of decoded images to keep, past it the ones the level doesn\'t use are dropped')
+    args = parser.parse_args()
+
+    if args.headless:
+        # the same seed and the same input always play out the same game
+        random.seed(args.seed)
+        if args.input:
+            script = ScriptedInput.load(args.input)
+        else:
+            script = ScriptedInput.random(args.frames, seed=args.seed)
+        game = Game(batched_physics=args.batched_physics, headless=True,
+                    asset_budget=int(args.asset_budget * 1024 * 1024), transition=args.transition,
+                    backend=args.backend)
+        print('started in ' + str(round(game.startup_time * 1000, 1)) + 'ms')
+        start = time.perf_counter()
+        frames = game.simulate(args.frames, script)
+        elapsed = time.perf_counter() - start
+        print(str(frames) + ' frames in ' + str(round(elapsed, 3)) + 's (' + str(round(frames / elapsed)) +
+              ' frames per second), level ' + str(game.level) + ', ' + str(len(game.enemies)) + ' enemies left')
+        print(str(len(game.assets.loaded())) + ' of ' + str(len(game.assets)) + ' assets loaded, ' +
+              str(round(game.assets.used_bytes / 1024)) + ' KB of images')
+        return
+
     pygame.init()
     pygame.mixer.init()  # Initialize the mixer
     pygame.mixer.music.load('PlatformerV2/data/music.wav')  # Load the background music. Replace 'background_music.mp3' with the path to your music file.
@@ -354,7 +701,9 @@ def main():
     pygame.display.update()  # Update the display
     pygame.time.delay(1000)  # Wait for 3000 milliseconds (3 seconds)
 
-    Game().run()
+    Game(batched_physics=args.batched_physics,
+         asset_budget=int(args.asset_budget * 1024 * 1024), transition=args.transition,
+         backend=args.backend).run(max_fps=args.max_fps, pipelined=args.pipelined)
 
 
 if __name__ == "__main__":
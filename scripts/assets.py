@@ -0,0 +1,116 @@
+import pygame
+
+from scripts.utils import Animation
+
+# 8 MB of decoded images, every image of the game together is a bit under 1 MB, so by default nothing is ever
+# dropped, a smaller budget makes the registry keep only what the current level uses
+DEFAULT_MAX_BYTES = 8 * 1024 * 1024
+
+
+# bytes of pixels an asset (an image, a list of images or an Animation) holds
+# a subsurface (an atlas image) counts as its own area, that's the part of the page it stands for
+def asset_bytes(asset):
+    if isinstance(asset, pygame.Surface):
+        return asset.get_width() * asset.get_height() * asset.get_bytesize()
+    if isinstance(asset, Animation):
+        # the flipped images are made at load time too, they take as much memory again
+        return sum(asset_bytes(img) for img in asset.images) + sum(asset_bytes(img) for img in asset.flipped_images)
+    if isinstance(asset, (list, tuple)):
+        return sum(asset_bytes(img) for img in asset)
+    return 0
+
+
+class AssetRegistry(dict):
+    """The game's assets, used like the dict they used to be (assets['grass'][0], assets.get('gun')), but an
+    entry is only loaded the first time it's asked for: register(key, loader) says how to load it, then
+    assets[key] calls loader() once and keeps what it returns (dict only calls __missing__ for keys it doesn't have).
+    Every lookup stamps the entry with the current level, so the registry knows which entries a level uses.
+    used_bytes is the memory of the decoded images of every loaded entry. When loading an entry takes it past
+    max_bytes, entries the current level hasn't used are dropped, the ones used longest ago first, and load again
+    if they're needed again. Pinned entries are always kept, they're for assets something holds on to for the whole
+    game (the particle system keeps its images, for example), dropping those would free nothing.
+    new_level() starts a new level: what it uses of the level before is kept, the rest can make room for what
+    it loads."""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        super().__init__()
+        self.max_bytes = max_bytes
+        self.used_bytes = 0
+        # key -> function that loads the asset, in the order they were registered
+        self.loaders = {}
+        self.pinned = set()
+        # key -> bytes of the loaded asset
+        self.sizes = {}
+        # key -> the last level it was used in, the entries used longest ago are dropped first
+        self.used_in = {}
+        self.level = 0
+        # how many times an entry was loaded and dropped, to see if the budget is too small
+        self.loads = 0
+        self.evictions = 0
+
+    def register(self, key, loader, pin=False):
+        self.loaders[key] = loader
+        if pin:
+            self.pinned.add(key)
+
+    def __missing__(self, key):
+        if key not in self.loaders:
+            raise KeyError(key)
+        asset = self.loaders[key]()
+        dict.__setitem__(self, key, asset)
+        self.sizes[key] = asset_bytes(asset)
+        self.used_bytes += self.sizes[key]
+        self.used_in[key] = self.level
+        self.loads += 1
+        if self.used_bytes > self.max_bytes:
+            self.evict()
+        return asset
+
+    def __getitem__(self, key):
+        asset = dict.__getitem__(self, key)
+        self.used_in[key] = self.level
+        return asset
+
+    # dict.get doesn't go through __missing__, this one loads the entry like assets[key] does
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    # every registered key counts, loaded or not
+    def __contains__(self, key):
+        return key in self.loaders or dict.__contains__(self, key)
+
+    def __iter__(self):
+        return iter(self.loaders)
+
+    def __len__(self):
+        return len(self.loaders)
+
+    def keys(self):
+        return self.loaders.keys()
+
+    def loaded(self):
+        return list(dict.keys(self))
+
+    def unload(self, key):
+        if dict.__contains__(self, key):
+            dict.__delitem__(self, key)
+            self.used_bytes -= self.sizes.pop(key)
+            del self.used_in[key]
+
+    # nothing is dropped right away: the new level hasn't used anything yet, so everything would look unused,
+    # entries it needs from the level before would be dropped only to be loaded again
+    def new_level(self):
+        self.level += 1
+
+    # drop entries until we're under max_bytes, never the pinned ones or the ones this level used
+    def evict(self):
+        candidates = [key for key, level in self.used_in.items() if level < self.level and key not in self.pinned]
+        candidates.sort(key=lambda key: self.used_in[key])
+        for key in candidates:
+            if self.used_bytes <= self.max_bytes:
+                break
+            self.unload(key)
+            self.evictions += 1
@@ -0,0 +1,152 @@
+import json
+import os
+
+import pygame
+
+from scripts.utils import BASE_IMG_PATH, decode_png, preload_pngs
+
+# where the packed pages and their index are written, next to the images they're made from
+ATLAS_PATH = 'PlatformerV2/data/atlas/'
+ATLAS_VERSION = 1
+# pages are this wide and at most this high, images are packed in rows (shelves) from the top down
+PAGE_WIDTH = 512
+MAX_PAGE_HEIGHT = 2048
+# empty pixels between two images
+PADDING = 1
+
+
+# every png an entry stands for, relative to BASE_IMG_PATH: a folder means all the pngs in it in name order
+# (that's also the order of the variants), anything else is a single image
+def source_files(entries):
+    files = []
+    for entry in entries:
+        if entry.endswith('.png'):
+            files.append(entry)
+        else:
+            for name in sorted(os.listdir(BASE_IMG_PATH + entry)):
+                if name.endswith('.png'):
+                    files.append(entry + '/' + name)
+    return files
+
+
+# what the atlas on disk was built from: every source png with its size and modification time
+def source_stamps(files):
+    stamps = {}
+    for path in files:
+        stat = os.stat(BASE_IMG_PATH + path)
+        stamps[path] = [stat.st_size, stat.st_mtime_ns]
+    return stamps
+
+
+# put images (a list of (path, width, height)) on pages, returns path -> [page, x, y, width, height]
+# and the height every page needs
+def pack(sizes):
+    placements = {}
+    page_heights = [0]
+    # tallest first, so each shelf wastes as little height as possible
+    shelf_x = shelf_y = shelf_height = 0
+    for path, width, height in sorted(sizes, key=lambda size: (-size[2], -size[1], size[0])):
+        if width > PAGE_WIDTH or height > MAX_PAGE_HEIGHT:
+            raise ValueError(path + ' is too big for a ' + str(PAGE_WIDTH) + ' pixel wide atlas page')
+        if shelf_x + width > PAGE_WIDTH:
+            # next shelf
+            shelf_y += shelf_height + PADDING
+            shelf_x = shelf_height = 0
+        if shelf_y + height > MAX_PAGE_HEIGHT:
+            # next page
+            page_heights.append(0)
+            shelf_x = shelf_y = shelf_height = 0
+        placements[path] = [len(page_heights) - 1, shelf_x, shelf_y, width, height]
+        shelf_x += width + PADDING
+        shelf_height = max(shelf_height, height)
+        page_heights[-1] = max(page_heights[-1], shelf_y + height)
+    return placements, page_heights
+
+
+class Atlas:
+    """The small images of the game (tiles, animation frames, particles) packed onto a few big page surfaces.
+    image(path) and images(folder) hand out subsurfaces of the pages, they draw exactly like the image
+    loaded from its own file would (black is transparent), but all of them live in a handful of surfaces.
+    rect(path) gives the page and the area of an image on it, for blitting with area=.
+    Building loads every png once and writes the pages and an index to ATLAS_PATH. The next start only loads
+    the pages, as long as no source png was added, removed or changed since (see load_or_build)."""
+
+    def __init__(self, pages, placements):
+        self.pages = pages
+        # path -> [page, x, y, width, height]
+        self.placements = placements
+        self.subsurfaces = {}
+        for path, (page, x, y, width, height) in placements.items():
+            self.subsurfaces[path] = pages[page].subsurface((x, y, width, height))
+
+    def __contains__(self, path):
+        return path in self.placements
+
+    def image(self, path):
+        return self.subsurfaces[path]
+
+    # every image of a folder, in name order like load_images
+    def images(self, folder):
+        prefix = folder + '/'
+        return [self.subsurfaces[path] for path in sorted(self.placements)
+                if path.startswith(prefix) and '/' not in path[len(prefix):]]
+
+    # (page surface, area rect) of an image
+    def rect(self, path):
+        page, x, y, width, height = self.placements[path]
+        return self.pages[page], pygame.Rect(x, y, width, height)
+
+    @staticmethod
+    def _finish_page(page):
+        # same as load_image: convert for fast blits, black is transparent
+        page = page.convert()
+        page.set_colorkey((0, 0, 0))
+        return page
+
+    @classmethod
+    def build(cls, entries, path=ATLAS_PATH):
+        files = source_files(entries)
+        # decoded on a thread pool instead of one png after the other
+        preload_pngs([BASE_IMG_PATH + file for file in files])
+        images = {file: decode_png(BASE_IMG_PATH + file) for file in files}
+        placements, page_heights = pack([(file, img.get_width(), img.get_height()) for file, img in images.items()])
+        pages = [pygame.Surface((PAGE_WIDTH, height)) for height in page_heights]
+        for file, (page, x, y, width, height) in placements.items():
+            pages[page].blit(images[file], (x, y))
+
+        os.makedirs(path, exist_ok=True)
+        for i, page in enumerate(pages):
+            pygame.image.save(page, path + 'page_' + str(i) + '.png')
+        f = open(path + 'atlas.json', 'w')
+        json.dump({'version': ATLAS_VERSION, 'entries': list(entries), 'sources': source_stamps(files),
+                   'pages': len(pages), 'placements': placements}, f)
+        f.close()
+        return cls([cls._finish_page(page) for page in pages], placements)
+
+    # the atlas written by build, None if there isn't one or it's out of date
+    @classmethod
+    def load(cls, entries, path=ATLAS_PATH):
+        if not os.path.exists(path + 'atlas.json'):
+            return None
+        f = open(path + 'atlas.json', 'r')
+        index = json.load(f)
+        f.close()
+        if index.get('version') != ATLAS_VERSION or index.get('entries') != list(entries):
+            return None
+        try:
+            if index['sources'] != source_stamps(source_files(entries)):
+                return None
+            page_files = [path + 'page_' + str(i) + '.png' for i in range(index['pages'])]
+            preload_pngs(page_files)
+            pages = [decode_png(page_file) for page_file in page_files]
+        except OSError:
+            # a source or a page went missing
+            return None
+        return cls([cls._finish_page(page) for page in pages], index['placements'])
+
+    @classmethod
+    def load_or_build(cls, entries, path=ATLAS_PATH):
+        atlas = cls.load(entries, path)
+        if atlas is None:
+            atlas = cls.build(entries, path)
+        return atlas
@@ -0,0 +1,97 @@
+import pygame
+
+
+class SurfaceBackend:
+    """Shows the small display surface the game draws on in a window made by pygame.display.set_mode.
+    The display is scaled straight into the window surface, which already exists, so presenting a frame doesn't
+    make a new surface (pygame.transform.scale without a destination makes a new window sized one every frame).
+    When the window is a whole multiple of the display (640x480 for 320x240), the scale covers the whole window;
+    when it's the same size it's a plain blit. Any other window size keeps the display's aspect ratio: it's scaled
+    into the largest area of the window that fits, with black bars around it."""
+
+    name = 'surface'
+
+    def __init__(self, display_size, window_size, caption=''):
+        pygame.display.set_caption(caption)
+        self.screen = pygame.display.set_mode(window_size)
+        self.window_size = tuple(window_size)
+        scale_x = window_size[0] / display_size[0]
+        scale_y = window_size[1] / display_size[1]
+        self.same_size = tuple(display_size) == self.window_size
+        self.integer_scale = scale_x == scale_y and scale_x == int(scale_x)
+        if self.integer_scale:
+            self.target = self.screen
+        else:
+            scale = min(scale_x, scale_y)
+            size = (int(display_size[0] * scale), int(display_size[1] * scale))
+            area = pygame.Rect((window_size[0] - size[0]) // 2, (window_size[1] - size[1]) // 2, size[0], size[1])
+            # a subsurface shares the window's pixels, scaling into it draws right into the window
+            self.target = self.screen.subsurface(area)
+        # the black bars have to be drawn again after something else covered the whole window
+        self.clear_bars = True
+
+    def present(self, display):
+        if self.same_size:
+            self.screen.blit(display, (0, 0))
+        else:
+            if self.clear_bars and not self.integer_scale:
+                self.screen.fill((0, 0, 0))
+            pygame.transform.scale(display, self.target.get_size(), self.target)
+        self.clear_bars = False
+        # Update the screen with every change made
+        pygame.display.flip()
+
+    # show a surface as big as the window as it is (the messages between levels)
+    def present_window(self, surf):
+        self.screen.blit(surf, (0, 0))
+        self.clear_bars = True
+        pygame.display.flip()
+
+
+class RendererBackend:
+    """Shows the display through SDL2's renderer (pygame._sdl2.video): every frame the display's pixels are copied
+    into one streaming texture made at the start, and the renderer stretches that texture over the window, on the
+    graphics card when there is one. software=True asks for SDL's software renderer, that works everywhere.
+    The renderer's logical size is the display's size, so SDL keeps the aspect ratio and adds the bars itself.
+    The images still need pygame.display.set_mode for convert() to know the pixel format, so there's a hidden
+    1x1 window next to the real one. Because of it closing the real window only sends WINDOWCLOSE, not QUIT,
+    the game and the editor quit on either."""
+
+    name = 'renderer'
+
+    def __init__(self, display_size, window_size, caption='', software=False):
+        from pygame._sdl2 import video
+
+        self.video = video
+        self.screen = pygame.display.set_mode((1, 1), pygame.HIDDEN)
+        self.window_size = tuple(window_size)
+        self.window = video.Window(caption, size=window_size)
+        self.renderer = video.Renderer(self.window, accelerated=0 if software else -1)
+        self.renderer.logical_size = tuple(display_size)
+        self.texture = video.Texture(self.renderer, display_size, streaming=True)
+
+    def present(self, display):
+        self.texture.update(display)
+        self.renderer.clear()
+        self.texture.draw()
+        self.renderer.present()
+
+    def present_window(self, surf):
+        # rare (between levels), so a texture made just for it is fine
+        texture = self.video.Texture.from_surface(self.renderer, surf)
+        self.renderer.clear()
+        texture.draw(dstrect=(0, 0) + self.renderer.logical_size)
+        self.renderer.present()
+
+
+# name -> function making the backend from (display_size, window_size, caption)
+BACKENDS = {
+    'surface': SurfaceBackend,
+    'renderer': RendererBackend,
+    'software-renderer': lambda display_size, window_size, caption='': RendererBackend(display_size, window_size,
+                                                                                       caption, software=True),
+}
+
+
+def create_backend(name, display_size, window_size, caption=''):
+    return BACKENDS[name](display_size, window_size, caption)
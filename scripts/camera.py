@@ -0,0 +1,57 @@
+import numpy as np
+import pygame
+
+# how far outside the screen something still counts as visible, in pixel
+# big enough for the biggest sprite (an enemy with its gun) that's positioned by its top left or center
+DEFAULT_MARGIN = 16
+
+
+class Camera:
+    """The part of the world that's on screen: the view is the display's size with its top left at the scroll.
+    Subsystems ask it what they can skip: sees_rect for one object, sees_points for the positions of a whole
+    numpy system at once. Something is visible if it's inside the view grown by margin on every side.
+    drawn and culled count how many objects were visible and how many were skipped since reset_counts,
+    for debugging and the benchmark."""
+
+    def __init__(self, size, margin=DEFAULT_MARGIN):
+        self.size = tuple(size)
+        self.margin = margin
+        self.scroll = (0, 0)
+        self.drawn = 0
+        self.culled = 0
+
+    # put the top left of the view at scroll (the render scroll of the frame)
+    def move(self, scroll):
+        self.scroll = (scroll[0], scroll[1])
+
+    def reset_counts(self):
+        self.drawn = 0
+        self.culled = 0
+
+    # the view in world pixel grown by margin, as a pygame Rect
+    def rect(self, margin=None):
+        if margin is None:
+            margin = self.margin
+        return pygame.Rect(self.scroll[0] - margin, self.scroll[1] - margin,
+                           self.size[0] + margin * 2, self.size[1] + margin * 2)
+
+    def sees_rect(self, rect, margin=None):
+        visible = self.rect(margin).colliderect(rect)
+        if visible:
+            self.drawn += 1
+        else:
+            self.culled += 1
+        return visible
+
+    # which of the points (an n x 2 array of world positions) are visible, as a bool array
+    def sees_points(self, points, margin=None):
+        if margin is None:
+            margin = self.margin
+        left = self.scroll[0] - margin
+        top = self.scroll[1] - margin
+        visible = ((points[:, 0] >= left) & (points[:, 0] < left + self.size[0] + margin * 2)
+                   & (points[:, 1] >= top) & (points[:, 1] < top + self.size[1] + margin * 2))
+        drawn = int(np.count_nonzero(visible))
+        self.drawn += drawn
+        self.culled += len(points) - drawn
+        return visible
@@ -0,0 +1,25 @@
+from array import array
+
+# the grid is stored in square chunks of CHUNK_SIZE x CHUNK_SIZE tiles instead of one "x;y" string per tile
+# CHUNK_SIZE is a power of 2, so a tile coordinate splits into chunk/local coordinate with >> and & (no division)
+# >> is a floor division for negative numbers too: -1 >> 4 = -1, so tile -1 lives in chunk -1 like it should
+CHUNK_SHIFT = 4
+CHUNK_SIZE = 1 << CHUNK_SHIFT
+CHUNK_MASK = CHUNK_SIZE - 1
+# tile id 0 is an empty cell, every other id is an index into Tilemap.palette
+EMPTY = 0
+# 'H' is an unsigned 16-bit integer, so a full chunk costs 2 bytes per cell instead of a dict per tile
+EMPTY_CHUNK = array('H', [EMPTY]) * (CHUNK_SIZE * CHUNK_SIZE)
+
+
+class Chunk:
+    # __slots__ stops python from giving every chunk its own __dict__
+    __slots__ = ('tiles', 'count', 'version')
+
+    def __init__(self, tiles=None):
+        # tiles[local_y * CHUNK_SIZE + local_x] is the tile id of that cell
+        self.tiles = array('H', EMPTY_CHUNK) if tiles is None else tiles
+        # number of cells that are not empty, when it reaches 0 the chunk can be thrown away
+        self.count = CHUNK_SIZE * CHUNK_SIZE - self.tiles.count(EMPTY)
+        # bumped every time a cell changes so caches built from this chunk know they're stale
+        self.version = 0
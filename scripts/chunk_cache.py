@@ -0,0 +1,125 @@
+import pygame
+
+from scripts.chunk import CHUNK_SHIFT, CHUNK_SIZE
+
+# 16 MB of baked surfaces, a 16x16 chunk of 16 pixel tiles is a 256x256 surface (256 KB at 32 bits per pixel)
+# so this keeps 64 chunks around, far more than the 6 chunks a 320x240 camera can see at once
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+
+
+class BakedChunk:
+    __slots__ = ('surf', 'pos', 'chunk', 'version', 'size')
+
+    def __init__(self, surf, pos, chunk, version):
+        self.surf = surf
+        # top left of the surface in world pixel
+        self.pos = pos
+        # the chunk object and the version it was baked from, if either changes the surface is stale
+        self.chunk = chunk
+        self.version = version
+        self.size = surf.get_width() * surf.get_height() * surf.get_bytesize()
+
+
+class ChunkRenderCache:
+    """Draws every grid tile of a chunk onto one surface once, so rendering the tilemap is a handful of blits
+    (one per chunk the camera overlaps) instead of one blit per visible tile.
+    A baked chunk is thrown away as soon as the chunk it came from is edited (every edit bumps Chunk.version),
+    that's how the editor placing/removing tiles or running autotile shows up on screen.
+    When the baked surfaces use more than max_bytes, the ones furthest from the camera are dropped first.
+    before_bake, when it's set, is called right before a chunk is drawn onto its surface: baking blits the tile
+    images, which the render thread (Game.run(pipelined=True)) may be blitting at the same time, and SDL changes
+    a surface's blit map while blitting from it. The game sets it to RenderThread.wait, so a frame that bakes
+    waits for the render thread to finish first, the frames that don't bake anything never wait."""
+
+    def __init__(self, tilemap, max_bytes=DEFAULT_MAX_BYTES):
+        self.tilemap = tilemap
+        self.max_bytes = max_bytes
+        # (chunk_x, chunk_y) -> BakedChunk
+        self.baked = {}
+        self.used_bytes = 0
+        self.before_bake = None
+
+    # drop every baked surface, used when a new map is loaded or the tile images change
+    def clear(self):
+        self.baked = {}
+        self.used_bytes = 0
+
+    # drop the baked surface of the chunk that contains tile position pos=(x, y)
+    def invalidate(self, pos):
+        self.drop((pos[0] >> CHUNK_SHIFT, pos[1] >> CHUNK_SHIFT))
+
+    # drop the baked surface of the chunk at key=(chunk_x, chunk_y)
+    def drop(self, key):
+        entry = self.baked.pop(key, None)
+        if entry is not None:
+            self.used_bytes -= entry.size
+
+    # return the baked surface for the chunk at key, baking it again if the chunk changed since last time
+    def get(self, key, chunk):
+        entry = self.baked.get(key)
+        if entry is not None and entry.chunk is chunk and entry.version == chunk.version:
+            return entry
+        self.drop(key)
+        entry = self.bake(key, chunk)
+        if entry is not None:
+            self.baked[key] = entry
+            self.used_bytes += entry.size
+        return entry
+
+    def bake(self, key, chunk):
+        tilemap = self.tilemap
+        tile_size = tilemap.tile_size
+        assets = tilemap.game.assets
+        base_x = key[0] << CHUNK_SHIFT
+        base_y = key[1] << CHUNK_SHIFT
+        blits = []
+        bounds = None
+        # x outer and y inner, the same order Tilemap.render used to blit tiles one by one
+        for local_x in range(CHUNK_SIZE):
+            for local_y in range(CHUNK_SIZE):
+                tile_id = chunk.tiles[(local_y << CHUNK_SHIFT) | local_x]
+                if tile_id:
+                    tile_type, variant = tilemap.palette[tile_id]
+                    img = assets[tile_type][variant]
+                    tile_rect = img.get_rect(topleft=((base_x + local_x) * tile_size, (base_y + local_y) * tile_size))
+                    # some images (large decor) are bigger than a tile, grow the surface so nothing gets cut off
+                    bounds = tile_rect if bounds is None else bounds.union(tile_rect)
+                    blits.append((img, tile_rect.topleft))
+        if bounds is None:
+            return None
+
+        if self.before_bake is not None:
+            self.before_bake()
+        surf = pygame.Surface(bounds.size)
+        # tiles use black as their transparent color, so the baked chunk does the same
+        surf.fill((0, 0, 0))
+        surf.blits([(img, (pos[0] - bounds.x, pos[1] - bounds.y)) for img, pos in blits], doreturn=False)
+        # RLEACCEL makes colorkey blits of a surface that never changes much faster
+        surf.set_colorkey((0, 0, 0), pygame.RLEACCEL)
+        return BakedChunk(surf, bounds.topleft, chunk, chunk.version)
+
+    # blit every chunk overlapping the chunk range [cx0, cx1] x [cy0, cy1] onto surf
+    def render(self, surf, offset, cx0, cx1, cy0, cy1):
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                chunk = self.tilemap.chunk_at((cx, cy))
+                if chunk is None:
+                    continue
+                entry = self.get((cx, cy), chunk)
+                if entry is not None:
+                    surf.blit(entry.surf, (entry.pos[0] - offset[0], entry.pos[1] - offset[1]))
+
+        if self.used_bytes > self.max_bytes:
+            self.evict(((cx0 + cx1) / 2, (cy0 + cy1) / 2), (cx0, cx1, cy0, cy1))
+
+    # drop baked chunks, the furthest from center (in chunk coordinate) first, until we're under max_bytes
+    # chunks inside the visible range are never dropped, we'd only have to bake them again next frame
+    def evict(self, center, visible):
+        cx0, cx1, cy0, cy1 = visible
+        candidates = [key for key in self.baked if not (cx0 <= key[0] <= cx1 and cy0 <= key[1] <= cy1)]
+        candidates.sort(key=lambda key: (key[0] - center[0]) ** 2 + (key[1] - center[1]) ** 2, reverse=True)
+        for key in candidates:
+            if self.used_bytes <= self.max_bytes:
+                break
+            self.drop(key)
+
@@ -1,58 +1,132 @@
 import random
 
+import pygame
+
+# clouds are between 0.2 (far away, moves the least with the camera) and 0.8 deep
+MIN_DEPTH = 0.2
+MAX_DEPTH = 0.8
+# how fast the wind pushes the farthest and the nearest clouds, in pixels per frame
+MIN_SPEED = 0.05
+MAX_SPEED = 0.1
+
 
 class Cloud:
     # Cloud Constructor
+    # pos is where the cloud is in its band's strip, once it's in a band its depth and speed are the band's
     def __init__(self, pos, img, speed, depth):
         self.pos = list(pos)
         self.img = img
         self.speed = speed
         self.depth = depth
 
-    # update the position of the cloud based on its speed, by incrementing X-axis by its speed
+
+class CloudBand:
+    """Every cloud of one depth range drawn once onto a strip surface, which then moves like one big cloud.
+    All clouds of a band have the band's depth (how much they move with the camera) and speed (how fast the wind
+    pushes them), so they never move against each other and the strip never has to be drawn again, unless a
+    cloud is added to the band (then it's baked again on the next render).
+    The strip wraps around: a cloud hanging over its right (or bottom) edge is also drawn on the left (top),
+    so copies of the strip next to each other look seamless. The strip is a bit bigger than the screen,
+    so a band is at most 4 blits (2 copies across, 2 down) no matter how many clouds it has."""
+
+    def __init__(self, depth, speed, size):
+        self.depth = depth
+        self.speed = speed
+        self.size = size
+        self.clouds = []
+        # how far the wind moved the band
+        self.scroll = 0
+        self.strip = None
+        self.dirty = True
+
+    # the cloud takes the band's depth and speed, that's what it's drawn with from now on
+    def add(self, cloud):
+        cloud.depth = self.depth
+        cloud.speed = self.speed
+        self.clouds.append(cloud)
+        self.dirty = True
+
+    def bake(self):
+        width, height = self.size
+        strip = pygame.Surface(self.size)
+        # black is the transparent color of the cloud images, so the strip uses it too
+        strip.fill((0, 0, 0))
+        for cloud in self.clouds:
+            x = cloud.pos[0] % width
+            y = cloud.pos[1] % height
+            # the cloud where it is and its copies one strip to the left and up, for the part that wraps around
+            strip.blits([(cloud.img, (x + dx, y + dy)) for dx in (0, -width) for dy in (0, -height)], doreturn=False)
+        # RLEACCEL makes colorkey blits of a surface that never changes much faster
+        strip.set_colorkey((0, 0, 0), pygame.RLEACCEL)
+        self.strip = strip
+        self.dirty = False
+
     def update(self):
-        self.pos[0] += self.speed
+        self.scroll += self.speed
 
-    # render the cloud onto the surface(surf)
-    def render(self, surf, offset=(0, 0)):
-        # subtract offset value for camera work and multiply by depth to create parallax effect
-        render_pos = (self.pos[0] - offset[0] * self.depth, self.pos[1] - offset[1] * self.depth)
-        """The position is adjusted using modulo operations (%) to create a tiling effect. This ensures that if the 
-        image moves beyond the boundaries of the surface, it wraps around to the opposite side, 
-        giving the appearance of a seamless scrolling background.
-        (surf.get_width() + self.img.get_width()) and (surf.get_height() + self.img.get_height()) calculate the width 
-        and height of the tiled area. The image will wrap around within these dimensions.
-        Finally, the image is blitted onto the surface with its position adjusted based on the modulo calculations. 
-        The adjustments (- self.img.get_width() and - self.img.get_height()) are made 
-        to ensure that the image is correctly positioned within the tiled area."""
-        surf.blit(self.img, (render_pos[0] % (surf.get_width() + self.img.get_width()) - self.img.get_width(),
-                             render_pos[1] % (surf.get_height() + self.img.get_height()) - self.img.get_height()))
+    def render(self, surf, offset=(0, 0), margin=(0, 0)):
+        if not self.clouds:
+            return
+        if self.dirty:
+            self.bake()
+        width, height = self.size
+        """Subtract the camera offset multiplied by depth to create the parallax effect.
+        The position is adjusted using modulo operations (%) to create a tiling effect: the strip's left edge
+        is always somewhere in [-margin, width - margin), margin being the size of the biggest cloud, so a cloud
+        can be partly off screen on the left or top before it comes back in on the other side.
+        The copy one strip to the left covers the rest of the screen, same for the copy one strip up."""
+        x = (self.scroll - offset[0] * self.depth) % width - margin[0]
+        y = (-offset[1] * self.depth) % height - margin[1]
+        blits = []
+        for copy_x in (x, x - width):
+            for copy_y in (y, y - height):
+                # a copy that's completely off screen doesn't need a blit
+                if copy_x < surf.get_width() and copy_x + width > 0 and copy_y < surf.get_height() and copy_y + height > 0:
+                    blits.append((self.strip, (copy_x, copy_y)))
+        surf.blits(blits, doreturn=False)
 
 
 class Clouds:
     # Clouds constructor
-    # count is the number of cloud to create
-    def __init__(self, cloud_images, count=16):
-        self.clouds = []
+    # count is the number of cloud to create, bands the number of depth ranges they're put in: every cloud of a
+    # band moves the same, more bands give more different depths (finer parallax) for a few more blits per frame
+    # size is the size of the surface the clouds are drawn on
+    def __init__(self, cloud_images, count=16, bands=4, size=(320, 240)):
+        # the strips are as big as the screen plus the biggest cloud, so a cloud can leave the screen completely
+        # before it wraps around (it takes that long to come back in on the other side)
+        self.margin = (max(img.get_width() for img in cloud_images), max(img.get_height() for img in cloud_images))
+        strip_size = (size[0] + self.margin[0], size[1] + self.margin[1])
+        band_depth = (MAX_DEPTH - MIN_DEPTH) / bands
+        self.bands = []
+        # from the farthest to the nearest, the middle of its depth range is the depth of a band
+        # and nearer bands drift faster, like the wind pushing clouds that are closer
+        for i in range(bands):
+            depth = MIN_DEPTH + band_depth * (i + 0.5)
+            speed = MIN_SPEED + (MAX_SPEED - MIN_SPEED) * (depth - MIN_DEPTH) / (MAX_DEPTH - MIN_DEPTH)
+            self.bands.append(CloudBand(depth, speed, strip_size))
         # each iteration create a cloud to add to the list
         # random.random() : random float between 0 and 1
         for i in range(count):
-            self.clouds.append(Cloud((random.random() * 99999, random.random() * 99999), random.choice(cloud_images),
-                                     random.random() * 0.05 + 0.05, random.random() * 0.6 + 0.2))
-        # Advanced coding technique
-        """After creating all the clouds, they are sorted based on their depth using a lambda function as the key 
-        for sorting
-        . This ensures that clouds 
-        with higher depth (closer to the viewer) appear in front of clouds with lower depth."""""
-        self.clouds.sort(key=lambda x: x.depth)
-
-    # update every cloud in the collection by calling update method in class Cloud
-    # , this will make each cloud move horizontally
+            self.add(Cloud((random.random() * 99999, random.random() * 99999), random.choice(cloud_images),
+                           random.random() * (MAX_SPEED - MIN_SPEED) + MIN_SPEED,
+                           random.random() * (MAX_DEPTH - MIN_DEPTH) + MIN_DEPTH))
+
+    # put the cloud in the band its depth falls into
+    def add(self, cloud):
+        self.bands[min(int((cloud.depth - MIN_DEPTH) / (MAX_DEPTH - MIN_DEPTH) * len(self.bands)),
+                       len(self.bands) - 1)].add(cloud)
+
+    # every cloud, farthest first
+    @property
+    def clouds(self):
+        return [cloud for band in self.bands for cloud in band.clouds]
+
+    # move every band horizontally by its speed
     def update(self):
-        for cloud in self.clouds:
-            cloud.update()
+        for band in self.bands:
+            band.update()
 
-    # render all the clouds in clouds list onto the surface by calling render method in class cloud
+    # render the bands onto the surface(surf), the farthest first, so nearer clouds appear in front of it
     def render(self, surf, offset=(0, 0)):
-        for cloud in self.clouds:
-            cloud.render(surf, offset=offset)
+        for band in self.bands:
+            band.render(surf, offset=offset, margin=self.margin)
@@ -0,0 +1,149 @@
+import numpy as np
+import pygame
+
+from scripts.chunk import CHUNK_SHIFT, CHUNK_SIZE, CHUNK_MASK
+
+
+class CollisionLayer:
+    """The solid tiles of the tilemap merged into as few rects as possible (greedy meshing, one chunk at a time),
+    so a long floor is one rect instead of one rect per tile.
+    rects_around(pos) returns the merged rects touching the 3x3 tiles around pos. The answer for every tile position
+    is built once and then handed out again and again: the same tuple holding the same Rect objects, so asking
+    doesn't allocate anything. That also means nobody is allowed to move or resize those rects.
+    Tilemap tells us which chunk changed (invalidate), only that chunk gets meshed again."""
+
+    def __init__(self, tilemap, offsets):
+        self.tilemap = tilemap
+        # the tile offsets of the 3x3 neighbourhood, in the order rects should come back in
+        self.offsets = offsets
+        self.clear()
+
+    def clear(self):
+        # chunk key -> list of CHUNK_SIZE * CHUNK_SIZE entries, the merged rect covering that cell or None
+        # None instead of a list for chunks without any solid tile
+        self.meshes = {}
+        # chunk key -> {(tile_x, tile_y): tuple of rects around that tile}
+        self.neighborhoods = {}
+
+    # forget everything built from the chunk at key=(chunk_x, chunk_y)
+    def invalidate(self, key):
+        self.meshes.pop(key, None)
+        # the tiles on the edge of the chunks around this one have this chunk in their 3x3 neighbourhood
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                self.neighborhoods.pop((key[0] + dx, key[1] + dy), None)
+
+    # forget the mesh and neighbourhoods of the chunk at key when the chunk itself is dropped from memory
+    # (ChunkStreamer.evict), it didn't change, so the chunks around it keep theirs
+    def drop(self, key):
+        self.meshes.pop(key, None)
+        self.neighborhoods.pop(key, None)
+
+    def mesh(self, key):
+        if key in self.meshes:
+            return self.meshes[key]
+        tilemap = self.tilemap
+        chunk = tilemap.chunk_at(key)
+        if chunk is None:
+            self.meshes[key] = None
+            return None
+
+        solid_ids = tilemap.solid_ids
+        solid = [solid_ids[tile_id] for tile_id in chunk.tiles]
+        cell_rects = [None] * (CHUNK_SIZE * CHUNK_SIZE)
+        tile_size = tilemap.tile_size
+        base_x = key[0] << CHUNK_SHIFT
+        base_y = key[1] << CHUNK_SHIFT
+        for y in range(CHUNK_SIZE):
+            for x in range(CHUNK_SIZE):
+                index = (y << CHUNK_SHIFT) | x
+                if not solid[index] or cell_rects[index] is not None:
+                    continue
+                # grow to the right as long as the tiles are solid and not taken by another rect
+                width = 1
+                while x + width < CHUNK_SIZE and solid[index + width] and cell_rects[index + width] is None:
+                    width += 1
+                # then grow down as long as the whole row under it is solid and free
+                height = 1
+                while y + height < CHUNK_SIZE:
+                    row = index + (height << CHUNK_SHIFT)
+                    if not all(solid[row + i] and cell_rects[row + i] is None for i in range(width)):
+                        break
+                    height += 1
+                rect = pygame.Rect((base_x + x) * tile_size, (base_y + y) * tile_size, width * tile_size,
+                                   height * tile_size)
+                for j in range(height):
+                    for i in range(width):
+                        cell_rects[index + (j << CHUNK_SHIFT) + i] = rect
+
+        if not any(solid):
+            cell_rects = None
+        self.meshes[key] = cell_rects
+        return cell_rects
+
+    def build_neighborhood(self, tile_x, tile_y):
+        rects = []
+        for offset in self.offsets:
+            x = tile_x + offset[0]
+            y = tile_y + offset[1]
+            cell_rects = self.mesh((x >> CHUNK_SHIFT, y >> CHUNK_SHIFT))
+            if cell_rects is not None:
+                rect = cell_rects[((y & CHUNK_MASK) << CHUNK_SHIFT) | (x & CHUNK_MASK)]
+                # several of the 9 tiles can belong to the same merged rect, only list it once
+                if rect is not None and not any(rect is other for other in rects):
+                    rects.append(rect)
+        return tuple(rects)
+
+    # the merged rects around pixel position pos, the tuple and the rects in it are shared, don't modify them
+    def rects_around(self, pos):
+        tile_size = self.tilemap.tile_size
+        tile_x = int(pos[0] // tile_size)
+        tile_y = int(pos[1] // tile_size)
+        key = (tile_x >> CHUNK_SHIFT, tile_y >> CHUNK_SHIFT)
+        cells = self.neighborhoods.get(key)
+        if cells is None:
+            cells = self.neighborhoods[key] = {}
+        rects = cells.get((tile_x, tile_y))
+        if rects is None:
+            rects = cells[(tile_x, tile_y)] = self.build_neighborhood(tile_x, tile_y)
+        return rects
+
+
+class SolidLookup:
+    """Which cells are physic tiles, for the chunks in keys only, looked up for whole numpy arrays of tile
+    positions at once (the batched physics and the projectiles). Every chunk asked for is a CHUNK_SIZE x CHUNK_SIZE
+    block of bools in one array, and a small table over the box of the chunk keys says which block a chunk is,
+    so it takes memory for the chunks that were asked for and not for the map in between them.
+    Only those chunks are decoded. A position in a chunk that isn't in keys or has no tiles is never solid."""
+
+    def __init__(self, tilemap, keys):
+        self.keys = keys
+        solid_of_id = np.frombuffer(tilemap.solid_ids, dtype=np.uint8).astype(bool)
+        found = []
+        blocks = []
+        for key in keys:
+            chunk = tilemap.chunk_at(key)
+            if chunk is not None:
+                found.append(key)
+                blocks.append(solid_of_id[np.frombuffer(chunk.tiles, dtype=np.uint16)].reshape(CHUNK_SIZE, CHUNK_SIZE))
+        if not found:
+            self.index = None
+            return
+        # index[chunk_y, chunk_x] is the block of that chunk, -1 (the last block, all empty) if it has none
+        # there's a ring of -1 around the box, a chunk outside the box is clamped onto the ring
+        self.origin = (min(key[0] for key in found) - 1, min(key[1] for key in found) - 1)
+        self.index = np.full((max(key[1] for key in found) - self.origin[1] + 2,
+                              max(key[0] for key in found) - self.origin[0] + 2), -1, dtype=np.int32)
+        for i, key in enumerate(found):
+            self.index[key[1] - self.origin[1], key[0] - self.origin[0]] = i
+        blocks.append(np.zeros((CHUNK_SIZE, CHUNK_SIZE), dtype=bool))
+        self.blocks = np.stack(blocks)
+
+    # for integer arrays of tile positions x and y (they broadcast against each other), whether each is solid
+    def cells(self, x, y):
+        if self.index is None:
+            return np.zeros(np.broadcast(x, y).shape, dtype=bool)
+        height, width = self.index.shape
+        chunk_x = np.minimum(np.maximum((x >> CHUNK_SHIFT) - self.origin[0], 0), width - 1)
+        chunk_y = np.minimum(np.maximum((y >> CHUNK_SHIFT) - self.origin[1], 0), height - 1)
+        return self.blocks[self.index[chunk_y, chunk_x], y & CHUNK_MASK, x & CHUNK_MASK]
@@ -0,0 +1,120 @@
+import numpy as np
+
+
+class LiveList:
+    """The live objects of one kind (enemies, projectiles, ...), made so the game loop never has to copy the list.
+    remove() is O(1): the last object moves into the removed one's place (swap remove), so the order isn't kept.
+    Looping over it while removing is fine, including removing the current object or any other one:
+    every object that is in the list for the whole loop is visited exactly once, objects appended during the loop
+    are visited too. Only one loop over the same LiveList at a time."""
+
+    def __init__(self, items=()):
+        self.items = []
+        # id(item) -> where it is in self.items, so the objects in it don't have to be hashable
+        self.positions = {}
+        # the running loop has visited items[:cursor] and not the rest, 0 when nobody is looping
+        self.cursor = 0
+        for item in items:
+            self.append(item)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, item):
+        return id(item) in self.positions
+
+    def __iter__(self):
+        items = self.items
+        self.cursor = 0
+        try:
+            while self.cursor < len(items):
+                self.cursor += 1
+                yield items[self.cursor - 1]
+        finally:
+            self.cursor = 0
+
+    def _place(self, item, index):
+        self.items[index] = item
+        self.positions[id(item)] = index
+
+    def append(self, item):
+        self.positions[id(item)] = len(self.items)
+        self.items.append(item)
+
+    def remove(self, item):
+        items = self.items
+        hole = self.positions.pop(id(item))
+        if hole < self.cursor:
+            # the hole is in the part the loop already went through, keep that part packed with visited objects:
+            # the last visited one fills the hole and the hole moves to the first spot the loop hasn't visited
+            self.cursor -= 1
+            if hole != self.cursor:
+                self._place(items[self.cursor], hole)
+            hole = self.cursor
+        last = items.pop()
+        if hole < len(items):
+            self._place(last, hole)
+
+    def clear(self):
+        self.items.clear()
+        self.positions.clear()
+
+
+
+class ArrayPool:
+    """The base of the systems that keep their objects in numpy arrays instead of one Python object each
+    (ParticleSystem, SparkSystem, ProjectileSystem, PhysicsWorld): every array named in columns has one row per
+    object, rows 0 to count - 1 are the live ones. new_row() hands out the next row, doubling every array when
+    they're full. remove_row() swap removes one row: the last row moves into it, so nothing is shifted.
+    remove_rows() removes many rows at once, only the live rows past the new end move into the holes,
+    so the rows stay packed in the same few array operations however many are removed."""
+
+    # the names of the arrays (attributes of the subclass), all of them have the same number of rows
+    columns = ()
+
+    def __init__(self):
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.count = 0
+
+    def _grow(self):
+        capacity = len(getattr(self, self.columns[0])) * 2
+        for name in self.columns:
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+
+    # the row of a new object, it still has the values of whatever was there before, so set all of them
+    def new_row(self):
+        if self.count == len(getattr(self, self.columns[0])):
+            self._grow()
+        self.count += 1
+        return self.count - 1
+
+    # remove row, returns the row that moved into it (the old last row, row itself if it was the last one)
+    def remove_row(self, row):
+        last = self.count - 1
+        if row != last:
+            for name in self.columns:
+                array = getattr(self, name)
+                array[row] = array[last]
+        self.count = last
+        return last
+
+    # remove every row that's True in kill, a bool array with one value per live row
+    def remove_rows(self, kill):
+        dead = np.flatnonzero(kill)
+        if len(dead):
+            alive = self.count - len(dead)
+            # the dead rows before the new end are holes, the living rows after it move into them
+            holes = dead[dead < alive]
+            movers = alive + np.flatnonzero(~kill[alive:])
+            for name in self.columns:
+                array = getattr(self, name)
+                array[holes] = array[movers]
+            self.count = alive
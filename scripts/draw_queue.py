@@ -0,0 +1,85 @@
+# the layers of a frame, drawn from the first to the last, so a later layer is on top of an earlier one
+LAYER_BACKGROUND = 0
+LAYER_CLOUDS = 1
+# off grid tiles (decoration) and then the grid tiles, Tilemap.render draws them in that order
+LAYER_TILES = 2
+# enemies, their guns and the player
+LAYER_ENTITIES = 3
+LAYER_PROJECTILES = 4
+LAYER_PARTICLES = 5
+# the level transition
+LAYER_OVERLAY = 6
+LAYER_COUNT = 7
+LAYER_NAMES = ['background', 'clouds', 'tiles', 'entities', 'projectiles', 'particles', 'overlay']
+
+
+class DrawLayer:
+    """What a subsystem draws on when it draws through the queue: it has the blit, blits and size methods of the
+    surface the frame ends up on, so Tilemap.render, PhysicsEntity.render, ParticleSystem.render and the others
+    can be given either a surface (the editor does that) or a layer of the queue without knowing the difference.
+    Drawing on it only adds (image, position) entries to its layer."""
+
+    def __init__(self, queue, layer):
+        self.queue = queue
+        self.entries = queue.layers[layer]
+
+    def get_width(self):
+        return self.queue.size[0]
+
+    def get_height(self):
+        return self.queue.size[1]
+
+    def get_size(self):
+        return self.queue.size
+
+    def blit(self, img, pos):
+        self.entries.append((img, pos))
+
+    def blits(self, entries, doreturn=True):
+        self.entries.extend(entries)
+
+
+class DrawQueue:
+    """Every image of a frame, collected from all the subsystems and drawn at the end by flush with one
+    Surface.blits call per layer (fblits on pygame-ce), in layer order, instead of one blit call per image from
+    everywhere in the code. Inside a layer the images are drawn in the order they were submitted, the same order
+    the old blit calls were in, so nothing ends up on top of something it used to be under.
+    counts has how many images every layer drew since reset_counts, that's the frame's draw count."""
+
+    def __init__(self, size):
+        self.size = tuple(size)
+        self.layers = [[] for i in range(LAYER_COUNT)]
+        self.targets = [DrawLayer(self, layer) for layer in range(LAYER_COUNT)]
+        self.counts = [0] * LAYER_COUNT
+
+    # what to draw on to draw in a layer
+    def layer(self, layer):
+        return self.targets[layer]
+
+    def submit(self, img, pos, layer):
+        self.layers[layer].append((img, pos))
+
+    def reset_counts(self):
+        self.counts = [0] * LAYER_COUNT
+
+    # drop everything submitted and not drawn yet (a frame that was skipped, see RenderThread)
+    def clear(self):
+        for entries in self.layers:
+            entries.clear()
+
+    # draw and empty every layer up to and including last_layer (all of them if None) onto surf
+    # something that isn't an image (the sparks are polygons) is drawn between two flushes
+    def flush(self, surf, last_layer=None):
+        if last_layer is None:
+            last_layer = LAYER_COUNT - 1
+        # pygame-ce's fblits is blits without building the list of rects nobody uses
+        draw = getattr(surf, 'fblits', None)
+        for layer in range(last_layer + 1):
+            entries = self.layers[layer]
+            if entries:
+                if draw is not None:
+                    draw(entries)
+                else:
+                    surf.blits(entries, doreturn=False)
+                self.counts[layer] += len(entries)
+                entries.clear()
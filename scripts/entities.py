@@ -2,16 +2,18 @@ import random
 
 import math
 
+import numpy as np
 import pygame
 
-from scripts.particle import Particle
-from scripts.spark import Spark
-
+from scripts.physics import COLLISION_NAMES
 
 class PhysicsEntity:
     def __init__(self, game, e_type, pos, size):
         self.game = game
         self.type = e_type
+        # the PhysicsWorld this entity lives in and its row in there, None when the entity does its own physics
+        self.world = None
+        self.slot = -1
         self.pos = list(pos)
         self.size = size
         self.velocity = [float(0), float(0)]
@@ -23,6 +25,80 @@ class PhysicsEntity:
         self.set_action('idle')  # Set which animation we're currently using
 
         self.last_movement = [0, 0]
+        # where the entity was before the last update, the game draws it between there and pos when the screen
+        # refreshes faster than the game updates (see Game.render), None: draw it at pos
+        self.prev_pos = None
+
+    # when the entity is in a PhysicsWorld its position, velocity, flip and collisions live in the world's arrays,
+    # pos and velocity then hand out that row of the array, so self.pos[0] += 1 still works the same way
+    @property
+    def pos(self):
+        if self.world is None:
+            return self._pos
+        return self.world.pos[self.slot]
+
+    @pos.setter
+    def pos(self, value):
+        if self.world is None:
+            self._pos = list(value)
+        else:
+            self.world.pos[self.slot] = value
+
+    @property
+    def velocity(self):
+        if self.world is None:
+            return self._velocity
+        return self.world.velocity[self.slot]
+
+    @velocity.setter
+    def velocity(self, value):
+        if self.world is None:
+            self._velocity = list(value)
+        else:
+            self.world.velocity[self.slot] = value
+
+    @property
+    def flip(self):
+        if self.world is None:
+            return self._flip
+        return bool(self.world.flip[self.slot])
+
+    @flip.setter
+    def flip(self, value):
+        if self.world is None:
+            self._flip = value
+        else:
+            self.world.flip[self.slot] = value
+
+    # in a PhysicsWorld this is a new dict made from the world's row, changing it doesn't change the collisions
+    @property
+    def collisions(self):
+        if self.world is None:
+            return self._collisions
+        return dict(zip(COLLISION_NAMES, self.world.collisions[self.slot].tolist()))
+
+    @collisions.setter
+    def collisions(self, value):
+        if self.world is None:
+            self._collisions = value
+        else:
+            self.world.collisions[self.slot] = [value[name] for name in COLLISION_NAMES]
+
+    # called by PhysicsWorld.add and PhysicsWorld.remove
+    def attach(self, world, slot):
+        self.world = world
+        self.slot = slot
+
+    # the entity gets its own copy of what the world kept for it
+    def detach(self):
+        world = self.world
+        slot = self.slot
+        self._pos = world.pos[slot].tolist()
+        self._velocity = world.velocity[slot].tolist()
+        self._flip = bool(world.flip[slot])
+        self._collisions = dict(zip(COLLISION_NAMES, world.collisions[slot].tolist()))
+        self.world = None
+        self.slot = -1
 
     def rect(self):
         # using top left position of the player sprite to handle physics
@@ -39,10 +115,23 @@ class PhysicsEntity:
             # .copy() creates a new instance of that animation
             self.animation = self.game.assets[self.type + '/' + self.action].copy()
 
+    # one frame of the entity: decide how to move, move (physics), then react to where we ended up
+    # with a PhysicsWorld the game does these 3 steps itself, begin_update for everyone, one world.step for
+    # everyone and then end_update for everyone
     def update(self, tilemap, movement=(0, 0)):
+        movement = self.begin_update(tilemap, movement)
+        self.move(tilemap, movement)
+        return self.end_update(tilemap, movement)
+
+    # everything that has to happen before the entity moves, returns the movement to use this frame
+    def begin_update(self, tilemap, movement=(0, 0)):
+        return movement
+
+    def move(self, tilemap, movement=(0, 0)):
         """we're resetting every frame so every time update function is called
          ,'self.collisions' got reset back to false"""
-        self.collisions = {'up': False, 'down': False, 'right': False, 'left': False}
+        collisions = self.collisions
+        collisions['up'] = collisions['down'] = collisions['right'] = collisions['left'] = False
 
         frame_movement = (movement[0] + self.velocity[0], movement[1] + self.velocity[1])  # Formula for movement
 
@@ -64,11 +153,11 @@ class PhysicsEntity:
                 # if entity right border collides with tiles right border, it will stop
                 if frame_movement[0] > 0:  # positive X is moving right
                     entity_rect.right = rect.left
-                    self.collisions['right'] = True
+                    collisions['right'] = True
                 # same goes for left border
                 if frame_movement[0] < 0:  # negative X is moving left
                     entity_rect.left = rect.right
-                    self.collisions['left'] = True
+                    collisions['left'] = True
                 self.pos[0] = entity_rect.x
 
         self.pos[1] += frame_movement[1]  # update Y movement
@@ -80,13 +169,25 @@ class PhysicsEntity:
                 # if entity right border collides with tiles right border, it will stop
                 if frame_movement[1] > 0:  # positive y is moving down
                     entity_rect.bottom = rect.top
-                    self.collisions['down'] = True
+                    collisions['down'] = True
                 # same goes for left border
                 if frame_movement[1] < 0:  # negative y is moving up
                     entity_rect.top = rect.bottom
-                    self.collisions['up'] = True
+                    collisions['up'] = True
                 self.pos[1] = entity_rect.y
 
+        # If falling speed is smaller than 5 then it will take smaller value
+        # If greater than 5 then velocity will be 5 because velocity cap at 5
+        # this is Y velocity
+        self.velocity[1] = min(5.0, self.velocity[1] + 0.1)
+
+        # we're not using X velocity, yet
+        # reset velocity back to zero if we're standing on a tile
+        if collisions['down'] or collisions['up']:
+            self.velocity[1] = 0
+
+    # everything that happens after the entity moved, returns True if the entity should be removed
+    def end_update(self, tilemap, movement=(0, 0)):
         # if moving right set flip to false because our img is already facing right
         if movement[0] > 0:
             self.flip = False
@@ -98,21 +199,12 @@ class PhysicsEntity:
         # not the actual movement that was executed upon
         self.last_movement = movement
 
-        # If falling speed is smaller than 5 then it will take smaller value
-        # If greater than 5 then velocity will be 5 because velocity cap at 5
-        # this is Y velocity
-        self.velocity[1] = min(5.0, self.velocity[1] + 0.1)
-
-        # we're not using X velocity, yet
-        # reset velocity back to zero if we're standing on a tile
-        if self.collisions['down'] or self.collisions['up']:
-            self.velocity[1] = 0
-
         self.animation.update()
 
     def render(self, surf, offset=(0, 0)):
         # this function will output image appropriate to our currently action
-        surf.blit(pygame.transform.flip(self.animation.img(), self.flip, False),
+        # the animation has every image facing both ways already, no flipping here
+        surf.blit(self.animation.img(self.flip),
                   (self.pos[0] - offset[0] + self.anim_offset[0], self.pos[1] - offset[1] + self.anim_offset[1]))
 
 
@@ -133,7 +225,26 @@ class Enemy(PhysicsEntity):
 
         self.walking = 0
 
-    def update(self, tilemap, movement=(0, 0)):
+    # lives in the PhysicsWorld like flip (see PhysicsEntity.pos)
+    @property
+    def walking(self):
+        if self.world is None:
+            return self._walking
+        return int(self.world.walking[self.slot])
+
+    @walking.setter
+    def walking(self, value):
+        if self.world is None:
+            self._walking = value
+        else:
+            self.world.walking[self.slot] = value
+
+    def detach(self):
+        walking = int(self.world.walking[self.slot])
+        super().detach()
+        self._walking = walking
+
+    def begin_update(self, tilemap, movement=(0, 0)):
         # if enemy is walking
         if self.walking:
             # scanning out in front of the direction you're facing -7/7 pixel in front
@@ -161,18 +272,18 @@ class Enemy(PhysicsEntity):
                     # , the enemy will be able to shoot
                     if (self.flip and dis[0] < 0):
                         # - 7 in X axis position and -1,5 in speed is because they're facing left
-                        self.game.projectiles.append([[self.rect().centerx - 7, self.rect().centery], -1.5, 0])
+                        pos = (self.rect().centerx - 7, self.rect().centery)
+                        self.game.projectiles.spawn(pos, -1.5)
                         for i in range(4):
-                            self.game.sparks.append(
-                                Spark(self.game.projectiles[-1][0], random.random() - 0.5 + math.pi, 2 + random.random()))
+                            self.game.sparks.spawn(pos, random.random() - 0.5 + math.pi, 2 + random.random())
 
                     # if the player is to the right and the enemy is looking right
                     if (not self.flip and dis[0] > 0):
                         # the other way around for facing right
-                        self.game.projectiles.append([[self.rect().centerx + 7, self.rect().centery], 1.5, 0])
+                        pos = (self.rect().centerx + 7, self.rect().centery)
+                        self.game.projectiles.spawn(pos, 1.5)
                         for i in range(4):
-                            self.game.sparks.append(
-                                Spark(self.game.projectiles[-1][0], random.random() - 0.5, 2 + random.random()))
+                            self.game.sparks.spawn(pos, random.random() - 0.5, 2 + random.random())
         # if not walking
         # check if this random number between 0 and 1 is lesser than 0.01 or not (1/100 chance of occurring)
         # since we're running at 60fps means 1 in every 1.67s if the enemy is not walking
@@ -180,8 +291,10 @@ class Enemy(PhysicsEntity):
             # then walking will be set to a random number
             # (30, 120) is the number of frame to continue to walk for which is the random number from 0.5 to 2 seconds
             self.walking = random.randint(30, 120)
+        return movement
 
-        super().update(tilemap, movement=movement)
+    def end_update(self, tilemap, movement=(0, 0)):
+        super().end_update(tilemap, movement=movement)
 
         # if the enemies are moving set action to run
         if movement[0] != 0:
@@ -193,29 +306,98 @@ class Enemy(PhysicsEntity):
         if abs(self.game.player.dashing) >= 50:
             # if rect of the enemy collide with player rect
             if self.rect().colliderect(self.game.player.rect()):
-                for i in range(30):
-                    angle = random.random() * math.pi * 2
-                    speed = random.random() * 5
-                    self.game.sparks.append(Spark(self.rect().center, angle, 2 + random.random()))
-                    self.game.particles.append(Particle(self.game, 'particle', self.rect().center,
-                                                   velocity=[math.cos(angle + math.pi) * speed * 0.5,
-                                                             math.sin(angle + math.pi) * speed * 0.5],
-                                                   frame=random.randint(0, 7)))
-                self.game.sparks.append(Spark(self.rect().center, 0, 5 + random.random()))
-                self.game.sparks.append(Spark(self.rect().center, math.pi, 5 + random.random()))
-
+                self.burst()
                 return True
 
+    # the player dashed through this enemy, it bursts into sparks and particles (the game removes it)
+    def burst(self):
+        self.game.death_burst(self.rect().center)
+        self.game.sparks.spawn(self.rect().center, 0, 5 + random.random())
+        self.game.sparks.spawn(self.rect().center, math.pi, 5 + random.random())
+
+    # begin_update for all the enemies of a PhysicsWorld at once: slots are their rows in the world, in the order
+    # the game updates them, and the decisions are the ones begin_update makes, on whole columns of the world
+    # returns the horizontal movement of every enemy, an enemy never moves itself vertically
+    @staticmethod
+    def begin_batch(game, world, slots, tilemap):
+        pos = world.pos[slots]
+        size = world.size[slots]
+        flip = world.flip[slots]
+        walking = world.walking[slots]
+        collisions = world.collisions[slots]
+        # where rect() would be, a pygame.Rect drops the fraction of the position (towards 0)
+        centerx = np.trunc(pos[:, 0]).astype(np.int64) + size[:, 0] // 2
+        centery = np.trunc(pos[:, 1]).astype(np.int64) + size[:, 1] // 2
+        walk = walking > 0
+        # the same spot below the ground in front of the enemy that begin_update gives solid_check
+        ground = tilemap.solid_cells((centerx + np.where(flip, -7, 7)) // tilemap.tile_size,
+                                     np.floor_divide(pos[:, 1] + 23, tilemap.tile_size).astype(np.int64), cached=True)
+        # turn around at the edge of a platform or against a wall, walk on otherwise
+        wall = collisions[:, COLLISION_NAMES.index('right')] | collisions[:, COLLISION_NAMES.index('left')]
+        flip ^= walk & (~ground | wall)
+        movement = np.where(walk & ground & ~wall, np.where(flip, -0.5, 0.5), 0.0)
+        walking -= walk
+        # the ones that just stopped walking shoot if the player is in front of them at about the same height
+        player_pos = game.player.pos
+        dis_x = player_pos[0] - pos[:, 0]
+        shoot = walk & (walking == 0) & (np.abs(player_pos[1] - pos[:, 1]) < 16) & np.where(flip, dis_x < 0, dis_x > 0)
+        # the random numbers are drawn in the order begin_update draws them enemy after enemy,
+        # by the ones shooting (their sparks) and the ones standing still (maybe they start walking)
+        for i in np.flatnonzero(shoot | ~walk).tolist():
+            if shoot[i]:
+                if flip[i]:
+                    shot_pos = (int(centerx[i]) - 7, int(centery[i]))
+                    game.projectiles.spawn(shot_pos, -1.5)
+                    for k in range(4):
+                        game.sparks.spawn(shot_pos, random.random() - 0.5 + math.pi, 2 + random.random())
+                else:
+                    shot_pos = (int(centerx[i]) + 7, int(centery[i]))
+                    game.projectiles.spawn(shot_pos, 1.5)
+                    for k in range(4):
+                        game.sparks.spawn(shot_pos, random.random() - 0.5, 2 + random.random())
+            elif random.random() < 0.01:
+                walking[i] = random.randint(30, 120)
+        world.flip[slots] = flip
+        world.walking[slots] = walking
+        return movement
+
+    # end_update for all the enemies of a PhysicsWorld at once, after the world's step: enemies are the enemies of
+    # slots in the same order and movement is what begin_batch returned
+    # returns the enemies the player's dash hit, the game bursts and removes them
+    # (last_movement isn't kept for them, only the player's is ever looked at, by Player.jump)
+    @staticmethod
+    def end_batch(game, world, enemies, slots, movement):
+        # face the way they moved
+        flip = world.flip[slots]
+        flip[movement > 0] = False
+        flip[movement < 0] = True
+        world.flip[slots] = flip
+        for enemy, running in zip(enemies, (movement != 0).tolist()):
+            enemy.animation.update()
+            action = 'run' if running else 'idle'
+            if action != enemy.action:
+                enemy.set_action(action)
+        player = game.player
+        if abs(player.dashing) < 50:
+            return []
+        # the enemy rects overlapping the player's rect, the same test as colliderect
+        player_rect = player.rect()
+        top_left = np.trunc(world.pos[slots]).astype(np.int64)
+        size = world.size[slots]
+        hit = ((top_left[:, 0] < player_rect.right) & (top_left[:, 0] + size[:, 0] > player_rect.left)
+               & (top_left[:, 1] < player_rect.bottom) & (top_left[:, 1] + size[:, 1] > player_rect.top))
+        return [enemies[i] for i in np.flatnonzero(hit).tolist()]
+
 
     def render(self, surf, offset=(0, 0)):
         super().render(surf, offset=offset)
 
         if self.flip:
-            # flip the gun in X axis (True) and don't flip in Y axis (False)
+            # the gun facing left, flipped in X axis once when it was loaded
             # self.rect().centerx - 4 (4 is 4 pixels) is to off set the gun and put it at the correct spot
             # subtract for gun width to account for the gun image because we render the gun
             # from the perspective of the top left when facing right and top right when facing left
-            surf.blit(pygame.transform.flip(self.game.assets['gun'], True, False),
+            surf.blit(self.game.assets['gun/flipped'],
                       (self.rect().centerx - 4 - self.game.assets['gun'].get_width() - offset[0],
                        self.rect().centery - offset[1]))
         else:
@@ -234,8 +416,8 @@ class Player(PhysicsEntity):
         self.wall_slide = False
         self.dashing = 0
 
-    def update(self, tilemap, movement=(0, 0)):
-        super().update(tilemap, movement=movement)
+    def end_update(self, tilemap, movement=(0, 0)):
+        super().end_update(tilemap, movement=movement)
 
         self.air_time += 1
         # when the player falls off the map for over 3 seconds
@@ -303,8 +485,8 @@ class Player(PhysicsEntity):
                 # and unevenly distributed amount of particle
                 pvelocity = [math.cos(angle) * speed, math.sin(angle) * speed]
                 # use the center of the player to spawn particle
-                self.game.particles.append(Particle(self.game, 'particle', self.rect().center, velocity=pvelocity
-                                                    , frame=random.randint(0, 7)))
+                self.game.particles.spawn('particle', self.rect().center, velocity=pvelocity,
+                                          frame=random.randint(0, 7))
 
         # this code will eventually bring self.dashing back to 0
         # this also serves as a timer
@@ -328,8 +510,7 @@ class Player(PhysicsEntity):
             # abs dashing/dashing gives the direction of the particle
             # and random.random() * 3 will make the particle move along instead of stay stationary
             pvelocity = [abs(self.dashing) / self.dashing * random.random() * 3, 0]
-            self.game.particles.append(Particle(self.game, 'particle', self.rect().center, velocity=pvelocity
-                                                , frame=random.randint(0, 7)))
+            self.game.particles.spawn('particle', self.rect().center, velocity=pvelocity, frame=random.randint(0, 7))
 
         # the remaining velocity from dashing will quickly be diminished by this code right here
         if self.velocity[0] > 0:
@@ -0,0 +1,74 @@
+import json
+import random
+
+import pygame
+
+# the names an input script uses for the keys the game listens to
+KEYS = {
+    'left': pygame.K_LEFT,
+    'right': pygame.K_RIGHT,
+    'jump': pygame.K_SPACE,
+    'dash': pygame.K_x,
+}
+# what a step does with its key, 'press' is a KEYDOWN event and 'release' a KEYUP event
+ACTIONS = {
+    'press': pygame.KEYDOWN,
+    'release': pygame.KEYUP,
+}
+
+
+class ScriptedInput:
+    """Keyboard input for a game nobody is playing (Game.simulate).
+    steps is a list of (frame, action, key): on frame, press or release key, for example (120, 'press', 'right').
+    Calling it with a frame number gives the pygame events of that frame, the same events the keyboard would have
+    given, so the game can't tell the difference."""
+
+    def __init__(self, steps=()):
+        self.steps = [tuple(step) for step in steps]
+        # frame -> events of that frame, built once so simulating doesn't make new events every frame
+        self.frames = {}
+        for frame, action, key in self.steps:
+            if action not in ACTIONS:
+                raise ValueError('unknown input action ' + repr(action) + ', expected one of ' + str(list(ACTIONS)))
+            if key not in KEYS:
+                raise ValueError('unknown input key ' + repr(key) + ', expected one of ' + str(list(KEYS)))
+            if frame not in self.frames:
+                self.frames[frame] = []
+            self.frames[frame].append(pygame.event.Event(ACTIONS[action], key=KEYS[key]))
+
+    def __call__(self, frame):
+        return self.frames.get(frame, [])
+
+    # a script saved as a JSON list of [frame, action, key]
+    @classmethod
+    def load(cls, path):
+        f = open(path, 'r')
+        steps = json.load(f)
+        f.close()
+        return cls(steps)
+
+    def save(self, path):
+        f = open(path, 'w')
+        json.dump([list(step) for step in self.steps], f)
+        f.close()
+
+    # someone mashing the keyboard for frames frames: runs left or right for a while, jumps and dashes now and then
+    # the same seed always gives the same script
+    @classmethod
+    def random(cls, frames, seed=0):
+        rng = random.Random(seed)
+        steps = []
+        held = None
+        for frame in range(frames):
+            # pick a new direction (or stand still) about every 2 seconds
+            if rng.random() < 1 / 120:
+                if held is not None:
+                    steps.append((frame, 'release', held))
+                held = rng.choice(['left', 'right', None])
+                if held is not None:
+                    steps.append((frame, 'press', held))
+            if rng.random() < 1 / 40:
+                steps.append((frame, 'press', 'jump'))
+            if rng.random() < 1 / 90:
+                steps.append((frame, 'press', 'dash'))
+        return cls(steps)
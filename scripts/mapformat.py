@@ -0,0 +1,171 @@
+import mmap
+import struct
+import sys
+from array import array
+
+import numpy as np
+
+from scripts.chunk import CHUNK_SIZE, EMPTY, Chunk
+
+"""Binary map format, everything little endian:
+header      magic, version, tile size, chunk size, palette length, offgrid type count, offgrid count, chunk count
+palette     one entry per tile id (starting at id 1): variant, name length, name
+offgrid     the types used by off grid tiles (same entry layout as the palette),
+            then one record per off grid tile: index into those types, x, y
+toc         the table of contents, one record per chunk: chunk x, chunk y, where its tiles start in the file
+chunks      CHUNK_SIZE * CHUNK_SIZE unsigned 16-bit tile ids per chunk, exactly what Chunk.tiles holds
+The toc lets us memory map the file and decode a chunk only when something asks for it."""
+MAGIC = b'PFMP'
+VERSION = 1
+HEADER = struct.Struct('<4sHHHHHII')
+NAME_ENTRY = struct.Struct('<HB')
+OFFGRID_ENTRY = struct.Struct('<Hdd')
+TOC_ENTRY = struct.Struct('<iiI')
+CHUNK_BYTES = CHUNK_SIZE * CHUNK_SIZE * 2
+
+
+# return True if the file at path starts like a binary map
+def is_binary_map(path):
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def _pack_names(entries):
+    data = b''
+    for tile_type, variant in entries:
+        name = tile_type.encode('utf-8')
+        data += NAME_ENTRY.pack(variant, len(name)) + name
+    return data
+
+
+def _unpack_names(data, offset, count):
+    entries = []
+    for i in range(count):
+        variant, length = NAME_ENTRY.unpack_from(data, offset)
+        offset += NAME_ENTRY.size
+        entries.append((bytes(data[offset:offset + length]).decode('utf-8'), variant))
+        offset += length
+    return entries, offset
+
+
+def save_binary(tilemap, path):
+    # every chunk has to be in memory before we write, the file we're replacing could be the one we read them from
+    # streaming would drop chunks again to decode them from that file later, so it stops first
+    tilemap.stop_streaming()
+    tilemap.load_all_chunks()
+    # nothing is read from the file anymore, close it: writing over a file that's still memory mapped truncates
+    # the mapping, and reading a page of it after that crashes (SIGBUS)
+    tilemap.close_source()
+    keys = sorted(tilemap.chunks)
+
+    offgrid_types = []
+    offgrid_type_ids = {}
+    offgrid = b''
+    for tile in tilemap.offgrid_tiles:
+        key = (tile['type'], tile['variant'])
+        if key not in offgrid_type_ids:
+            offgrid_type_ids[key] = len(offgrid_types)
+            offgrid_types.append(key)
+        offgrid += OFFGRID_ENTRY.pack(offgrid_type_ids[key], tile['pos'][0], tile['pos'][1])
+
+    head = HEADER.pack(MAGIC, VERSION, tilemap.tile_size, CHUNK_SIZE, len(tilemap.palette) - 1, len(offgrid_types),
+                       len(tilemap.offgrid_tiles), len(keys))
+    head += _pack_names(tilemap.palette[1:]) + _pack_names(offgrid_types) + offgrid
+
+    # chunk data starts right after the toc
+    offset = len(head) + TOC_ENTRY.size * len(keys)
+    toc = b''
+    for key in keys:
+        toc += TOC_ENTRY.pack(key[0], key[1], offset)
+        offset += CHUNK_BYTES
+
+    f = open(path, 'wb')
+    f.write(head)
+    f.write(toc)
+    for key in keys:
+        tiles = tilemap.chunks[key].tiles
+        if sys.byteorder == 'big':
+            tiles = array('H', tiles)
+            tiles.byteswap()
+        f.write(tiles.tobytes())
+    f.close()
+
+
+class BinaryMap:
+    """A binary map opened through a memory map. The header, palette and off grid tiles are read right away,
+    chunks are only decoded by read_chunk, so the OS only pages in the part of the file we actually use.
+    find_tiles looks for tile ids in a chunk without decoding it, and the ids given to erase are left out of every
+    chunk decoded after that: that's how Tilemap.extract takes the spawners out of a map without decoding
+    (and keeping) every chunk of it."""
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, version, self.tile_size, chunk_size, palette_count, offgrid_type_count, offgrid_count,
+         chunk_count) = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(path + ' is not a version ' + str(VERSION) + ' binary map')
+        if chunk_size != CHUNK_SIZE:
+            self.close()
+            raise ValueError(path + ' uses ' + str(chunk_size) + ' tile chunks, expected ' + str(CHUNK_SIZE))
+
+        # palette[i] is tile id i + 1
+        self.palette, offset = _unpack_names(self.data, HEADER.size, palette_count)
+        offgrid_types, offset = _unpack_names(self.data, offset, offgrid_type_count)
+        self.offgrid = []
+        for i in range(offgrid_count):
+            type_index, x, y = OFFGRID_ENTRY.unpack_from(self.data, offset)
+            offset += OFFGRID_ENTRY.size
+            self.offgrid.append({'type': offgrid_types[type_index][0], 'variant': offgrid_types[type_index][1],
+                                 'pos': [x, y]})
+
+        # (chunk_x, chunk_y) -> where that chunk's tiles start in the file
+        self.toc = {}
+        for cx, cy, chunk_offset in TOC_ENTRY.iter_unpack(self.data[offset:offset + TOC_ENTRY.size * chunk_count]):
+            self.toc[(cx, cy)] = chunk_offset
+
+        # erased[tile id] is True for the ids taken out of the map by erase, id 0 is empty anyway
+        self.erased = np.zeros(palette_count + 1, dtype=bool)
+        self.erasing = False
+
+    # the tile ids of the chunk at offset as a numpy array, index y * CHUNK_SIZE + x, the file data isn't kept
+    def chunk_ids(self, offset):
+        # slicing the mmap copies the bytes, so no numpy array keeps the mmap from being closed
+        return np.frombuffer(self.data[offset:offset + CHUNK_BYTES], dtype='<u2')
+
+    # (index, tile id) of every cell of the chunk at offset whose tile id is in wanted, index is y * CHUNK_SIZE + x
+    # wanted is a numpy bool array, wanted[tile id] is True for the ids we're looking for
+    def find_tiles(self, offset, wanted):
+        ids = self.chunk_ids(offset)
+        found = np.flatnonzero(wanted[ids] & ~self.erased[ids])
+        return list(zip(found.tolist(), ids[found].tolist()))
+
+    # leave the tile ids in ids out of every chunk decoded from now on (they're empty cells then)
+    # an id the tilemap made after loading the file can't be in it, there's nothing to leave out
+    def erase(self, ids):
+        self.erased[[tile_id for tile_id in ids if tile_id < len(self.erased)]] = True
+        self.erasing = True
+
+    # decode the chunk at offset, None if nothing is left in it once the erased ids are taken out
+    def read_chunk(self, offset):
+        data = self.data[offset:offset + CHUNK_BYTES]
+        if self.erasing:
+            ids = self.chunk_ids(offset)
+            erased = self.erased[ids]
+            if erased.any():
+                ids = ids.copy()
+                ids[erased] = EMPTY
+                data = ids.tobytes()
+        tiles = array('H')
+        tiles.frombytes(data)
+        if sys.byteorder == 'big':
+            tiles.byteswap()
+        chunk = Chunk(tiles)
+        return chunk if chunk.count else None
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
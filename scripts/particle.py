@@ -1,26 +1,102 @@
-class Particle:
-    def __init__(self, game, p_type, pos, velocity=[0, 0], frame=0):
+import numpy as np
+
+from scripts.container import ArrayPool
+
+# per type behaviour, particle type -> (sway, speed): the particle drifts sideways by sin(frame * speed) * sway pixels
+# every frame, that's what makes the leaves fall naturally - fall in a sin graph
+# speed 0.035 makes it move slower, sway 0.3 makes the curve in sin graph smaller
+SWAY = {
+    'leaf': (0.3, 0.035),
+}
+
+
+class ParticleSystem(ArrayPool):
+    """Every particle of the game in a few numpy arrays instead of one Particle object (and one Animation copy)
+    each: position, velocity, animation frame and type, one row per particle, rows 0 to count - 1 are alive.
+    update() moves and animates all of them at once, a particle is removed on the update after its animation
+    reached the last frame. Removing one moves the last particle into its row (swap remove), so nothing is
+    shifted and the rows stay packed (see ArrayPool). render() draws all of them with one Surface.blits call.
+    The images of a type come from game.assets['particle/' + type], an Animation that doesn't loop."""
+
+    columns = ('pos', 'velocity', 'frame', 'type')
+
+    def __init__(self, game, types=('leaf', 'particle'), capacity=256):
+        super().__init__()
         self.game = game
-        self.type = p_type
-        self.pos = list(pos)
-        self.velocity = list(velocity)
-        self.animation = self.game.assets['particle/' + p_type].copy()
-        self.animation.frame = frame
+        self.types = list(types)
+        self.type_ids = {p_type: i for i, p_type in enumerate(self.types)}
 
-    def update(self):
-        kill = False
-        # as soon as the update function return true that means the particle need to be removed
-        # return True once the animation has finished playing
-        if self.animation.done:
-            kill = True
+        # every image of every type in one list, a type's images start at first_image[type]
+        self.images = []
+        first_image = []
+        img_duration = []
+        last_frame = []
+        for p_type in self.types:
+            animation = game.assets['particle/' + p_type]
+            first_image.append(len(self.images))
+            self.images += animation.images
+            img_duration.append(animation.img_duration)
+            last_frame.append(animation.img_duration * len(animation.images) - 1)
+        self.first_image = np.array(first_image)
+        self.img_duration = np.array(img_duration)
+        self.last_frame = np.array(last_frame)
+        # half the size of every image, a particle is drawn centered on its position
+        self.half_sizes = np.array([(img.get_width() // 2, img.get_height() // 2) for img in self.images]).reshape(-1, 2)
+        self.sway = np.array([SWAY.get(p_type, (0, 0))[0] for p_type in self.types])
+        self.sway_speed = np.array([SWAY.get(p_type, (0, 0))[1] for p_type in self.types])
+
+        self.pos = np.zeros((capacity, 2))
+        self.velocity = np.zeros((capacity, 2))
+        self.frame = np.zeros(capacity, dtype=np.int64)
+        self.type = np.zeros(capacity, dtype=np.int8)
 
-        self.pos[0] += self.velocity[0]
-        self.pos[1] += self.velocity[1]
+    # frame is the animation frame to start on
+    def spawn(self, p_type, pos, velocity=(0, 0), frame=0):
+        i = self.new_row()
+        self.pos[i] = pos
+        self.velocity[i] = velocity
+        self.frame[i] = frame
+        self.type[i] = self.type_ids[p_type]
+
+    def update(self):
+        count = self.count
+        if not count:
+            return
+        pos = self.pos[:count]
+        frame = self.frame[:count]
+        p_type = self.type[:count]
+        last_frame = self.last_frame[p_type]
 
-        self.animation.update()
+        # a particle that already showed its last frame goes away after this update
+        kill = frame >= last_frame
+        pos += self.velocity[:count]
+        np.minimum(frame + 1, last_frame, out=frame)
+        sway = self.sway[p_type]
+        swaying = np.flatnonzero(sway)
+        if len(swaying):
+            pos[swaying, 0] += np.sin(frame[swaying] * self.sway_speed[p_type[swaying]]) * sway[swaying]
 
-        return kill
+        self.remove_rows(kill)
 
-    def render(self, surf, offset=(0, 0)):
-        img = self.animation.img()
-        surf.blit(img, (self.pos[0] - offset[0] - img.get_width() // 2, self.pos[1] - offset[1] - img.get_height() // 2))
+    # camera: only draw the particles it sees (see Camera.sees_points), all of them if None
+    # alpha: how far the time of the frame is from the last update to the next one (0 to 1), see
+    # ProjectileSystem.render (the sway of a leaf isn't undone, it's less than a pixel)
+    def render(self, surf, offset=(0, 0), camera=None, alpha=1):
+        count = self.count
+        if not count:
+            return
+        pos = self.pos[:count]
+        if alpha != 1:
+            pos = pos + self.velocity[:count] * (alpha - 1)
+        p_type = self.type[:count]
+        frame = self.frame[:count]
+        if camera is not None:
+            visible = camera.sees_points(pos)
+            pos = pos[visible]
+            p_type = p_type[visible]
+            frame = frame[visible]
+        image = self.first_image[p_type] + frame // self.img_duration[p_type]
+        # top left of every image, so the image is centered on the particle
+        corners = pos - offset - self.half_sizes[image]
+        images = self.images
+        surf.blits([(images[i], corner) for i, corner in zip(image.tolist(), corners.tolist())], doreturn=False)
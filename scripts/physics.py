@@ -0,0 +1,154 @@
+import numpy as np
+
+from scripts.chunk import CHUNK_SHIFT
+from scripts.container import ArrayPool
+
+# columns of PhysicsWorld.collisions, the same names PhysicsEntity.collisions uses
+COLLISION_NAMES = ('up', 'down', 'right', 'left')
+
+
+class PhysicsWorld(ArrayPool):
+    """Position, velocity, size and collision flags of every PhysicsEntity in numpy arrays, one row per entity.
+    step() moves every entity that asked to move this frame and resolves tile collisions for all of them at once,
+    doing exactly what PhysicsEntity.move does for a single entity, but as a handful of array operations.
+    An entity added to the world keeps no position, velocity, facing (flip) or collisions of its own any more,
+    those are read from and written to these arrays (see PhysicsEntity.pos), so code that goes through all the
+    entities at once (Enemy.begin_batch) works on whole columns instead of one entity at a time."""
+
+    columns = ('pos', 'velocity', 'size', 'movement', 'active', 'collisions', 'flip', 'walking')
+
+    def __init__(self, capacity=64):
+        super().__init__()
+        self.entities = []
+        self.pos = np.zeros((capacity, 2))
+        self.velocity = np.zeros((capacity, 2))
+        self.size = np.zeros((capacity, 2), dtype=np.int64)
+        # the movement input of this frame, and whether the entity is updated this frame at all
+        self.movement = np.zeros((capacity, 2))
+        self.active = np.zeros(capacity, dtype=bool)
+        self.collisions = np.zeros((capacity, len(COLLISION_NAMES)), dtype=bool)
+        # facing left (PhysicsEntity.flip), and how many more frames an enemy walks for (Enemy.walking, 0 otherwise)
+        self.flip = np.zeros(capacity, dtype=bool)
+        self.walking = np.zeros(capacity, dtype=np.int64)
+
+    def add(self, entity):
+        if entity.world is self:
+            return
+        slot = self.new_row()
+        self.entities.append(entity)
+        self.pos[slot] = entity.pos
+        self.velocity[slot] = entity.velocity
+        self.size[slot] = entity.size
+        self.movement[slot] = 0
+        self.active[slot] = False
+        self.collisions[slot] = [entity.collisions[name] for name in COLLISION_NAMES]
+        self.flip[slot] = entity.flip
+        self.walking[slot] = getattr(entity, 'walking', 0)
+        entity.attach(self, slot)
+
+    def remove(self, entity):
+        if entity.world is not self:
+            return
+        slot = entity.slot
+        # the entity gets its own values back, the ones it had in here
+        entity.detach()
+        # swap remove: the last row moves into the hole, so nothing after it has to shift
+        # the entity of the row that moved goes with it
+        moved = self.entities.pop()
+        if self.remove_row(slot) != slot:
+            self.entities[slot] = moved
+            moved.slot = slot
+
+    def clear(self):
+        for entity in self.entities.copy():
+            self.remove(entity)
+
+    # the entity in slot will be moved by the next step with this movement input
+    def set_movement(self, slot, movement):
+        self.movement[slot] = movement
+        self.active[slot] = True
+
+    # the same for many entities at once: slots is an array of slots, movement_x their horizontal movement input
+    def set_movements(self, slots, movement_x):
+        self.movement[slots, 0] = movement_x
+        self.movement[slots, 1] = 0
+        self.active[slots] = True
+
+    # where the tiles a group of rects overlap start and end, in tiles, for rects given by their top left (pos)
+    # and size, both axes at once: first[i] is the column and row of the top left tile of rect i, last[i] the
+    # bottom right one
+    @staticmethod
+    def _tile_span(pos, size, tile_size):
+        start = np.trunc(pos).astype(np.int64)
+        return start // tile_size, (start + size - 1) // tile_size
+
+    # the chunks the rects of the entities can touch this step, anywhere from where they are (pos) to where they
+    # want to go (pos + movement), as a frozenset of chunk keys
+    # an entity and its movement are smaller than a chunk, so it reaches at most 2 chunks on each axis and the
+    # chunks of the 4 corners of that area are all of them
+    @staticmethod
+    def _chunks_touched(pos, size, movement, tile_size):
+        first, last = PhysicsWorld._tile_span(pos, size, tile_size)
+        moved_first, moved_last = PhysicsWorld._tile_span(pos + movement, size, tile_size)
+        low = np.minimum(first, moved_first) >> CHUNK_SHIFT
+        high = np.maximum(last, moved_last) >> CHUNK_SHIFT
+        return frozenset(zip(np.concatenate((low[:, 0], high[:, 0], low[:, 0], high[:, 0])).tolist(),
+                             np.concatenate((low[:, 1], low[:, 1], high[:, 1], high[:, 1])).tolist()))
+
+    # for every rect, which of the columns (axis 0) or rows (axis 1) it overlaps have a solid tile in them
+    # returns (first index of that axis, hit[n, span]) where hit[i, k] is about column/row first[i] + k
+    @staticmethod
+    def _solid_lines(solid, tile_size, pos, size, axis):
+        first, last = PhysicsWorld._tile_span(pos, size, tile_size)
+        col0, row0 = first[:, 0], first[:, 1]
+        col1, row1 = last[:, 0], last[:, 1]
+        cols = col0[:, None] + np.arange(int((col1 - col0).max()) + 1)
+        rows = row0[:, None] + np.arange(int((row1 - row0).max()) + 1)
+        # cells past the end of a rect (rects aren't all the same size) are never solid
+        cells = solid.cells(cols[:, None, :], rows[:, :, None])
+        cells &= (rows <= row1[:, None])[:, :, None] & (cols <= col1[:, None])[:, None, :]
+        if axis == 0:
+            return col0, cells.any(axis=1)
+        return row0, cells.any(axis=2)
+
+    def step(self, tilemap):
+        slots = np.flatnonzero(self.active[:self.count])
+        if not len(slots):
+            return
+        tile_size = tilemap.tile_size
+
+        pos = self.pos[slots]
+        velocity = self.velocity[slots]
+        size = self.size[slots]
+        collisions = np.zeros((len(slots), len(COLLISION_NAMES)), dtype=bool)
+        frame_movement = self.movement[slots] + velocity
+        # only the chunks the entities can reach this step are looked at (and decoded on a streamed map),
+        # the tilemap keeps the lookup until they move into other chunks or a tile changes
+        solid = tilemap.solid_lookup(self._chunks_touched(pos, size, frame_movement, tile_size))
+
+        # same order as PhysicsEntity.move: move on X and push out of tiles, then the same on Y
+        for axis, (positive, negative) in enumerate(((2, 3), (1, 0))):
+            pos[:, axis] += frame_movement[:, axis]
+            first, hit = self._solid_lines(solid, tile_size, pos, size, axis)
+            colliding = hit.any(axis=1)
+            # moving right/down we end up against the first solid column/row we overlap, left/up against the last
+            nearest = first + hit.argmax(axis=1)
+            furthest = first + hit.shape[1] - 1 - hit[:, ::-1].argmax(axis=1)
+            moving_positive = colliding & (frame_movement[:, axis] > 0)
+            moving_negative = colliding & (frame_movement[:, axis] < 0)
+            # a rect can only be at whole pixels, that's where the entity ends up when it touched a tile
+            new_pos = np.trunc(pos[:, axis])
+            new_pos = np.where(moving_positive, nearest * tile_size - size[:, axis], new_pos)
+            new_pos = np.where(moving_negative, (furthest + 1) * tile_size, new_pos)
+            pos[:, axis] = np.where(colliding, new_pos, pos[:, axis])
+            collisions[:, positive] = moving_positive
+            collisions[:, negative] = moving_negative
+
+        # gravity, falling speed caps at 5, and we stop falling/rising when we hit a tile above or below
+        velocity[:, 1] = np.minimum(5.0, velocity[:, 1] + 0.1)
+        velocity[collisions[:, 0] | collisions[:, 1], 1] = 0
+
+        self.pos[slots] = pos
+        self.velocity[slots] = velocity
+        self.collisions[slots] = collisions
+        self.active[:self.count] = False
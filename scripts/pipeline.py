@@ -0,0 +1,125 @@
+import threading
+
+import pygame
+
+from scripts.draw_queue import DrawQueue
+
+
+class Frame:
+    """Everything one frame draws, captured from the game by Game.capture: every image with its position in a
+    DrawQueue and the polygons of the sparks. The positions are numbers worked out when it was captured, so a Frame
+    can be drawn while the game is already updating the entities, particles and projectiles of the next one.
+    The images are not copies: they're the game's own surfaces (the assets, the baked chunks and cloud strips), so
+    while a frame is drawn the game can't draw on them or blit from them. It never draws on them once they're made
+    (a chunk that changes gets a new surface), and baking a chunk blits the same tile images the frame may be
+    blitting, so the game waits for the render thread before it bakes (ChunkRenderCache.before_bake).
+    It's drawn onto surface (a surface of its own if none is given), which is then shown in the window.
+    drawn and culled are the camera's counts of the frame, the queue's counts are its draw count once it's drawn."""
+
+    def __init__(self, size, surface=None):
+        self.queue = DrawQueue(size)
+        self.surface = surface if surface is not None else pygame.Surface(size)
+        # see SparkSystem.polygons
+        self.sparks = []
+        self.drawn = 0
+        self.culled = 0
+
+
+class RenderThread:
+    """Draws frames on a thread of its own, so the game can update the next frame at the same time
+    (Game.run(pipelined=True)). pygame lets go of the GIL while it blits and scales, which is most of drawing.
+    There are two Frames (double buffering): the game captures into one while this thread draws the other.
+    hand_off gives this thread the frame the game just captured and returns the one to capture into next, it's
+    the only moment a frame changes hands, the game never touches a frame this thread has and the other way around.
+    A frame handed off while the one before it wasn't even started is drawn instead of that one (skipped),
+    the screen always shows the newest state. When this thread is still drawing the frame the game wants to
+    capture into next, hand_off waits for it, the game is never more than one frame ahead of the screen.
+    draw(frame) draws a frame onto its own surface, it's called on this thread only. This thread never shows
+    anything: SDL only promises its video functions (flipping the window, the renderer) work on the main thread,
+    so the game takes the newest drawn frame with take and shows it itself."""
+
+    def __init__(self, draw, size):
+        self.draw = draw
+        self.frames = [Frame(size), Frame(size)]
+        # the frame the game captures into
+        self.back = self.frames[0]
+        # the frame handed off and not picked up by this thread yet, the one it's drawing
+        # and the newest one it drew that the game hasn't taken yet
+        self.pending = None
+        self.drawing = None
+        self.ready = None
+        # frames drawn and frames skipped because a newer one was handed off before they were started
+        self.drawn = 0
+        self.skipped = 0
+        # an exception draw raised, raised again on the game's thread by the next hand_off
+        self.error = None
+        self.running = True
+        self.condition = threading.Condition()
+        # a daemon thread doesn't keep the program alive when the game quits
+        self.thread = threading.Thread(target=self.loop, name='render', daemon=True)
+        self.thread.start()
+
+    def loop(self):
+        while True:
+            with self.condition:
+                while self.pending is None and self.running:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                self.drawing = self.pending
+                self.pending = None
+            try:
+                self.draw(self.drawing)
+            except Exception as error:
+                with self.condition:
+                    self.error = error
+                    self.running = False
+                    self.drawing = None
+                    self.condition.notify_all()
+                return
+            with self.condition:
+                self.ready = self.drawing
+                self.drawing = None
+                self.drawn += 1
+                self.condition.notify_all()
+
+    # give frame (the one hand_off returned last time) to this thread, returns the frame to capture into next
+    def hand_off(self, frame):
+        with self.condition:
+            if self.error is not None:
+                raise self.error
+            if self.pending is not None:
+                self.skipped += 1
+            if self.ready is frame:
+                # it's drawn again, it can't be shown anymore
+                self.ready = None
+            self.pending = frame
+            self.condition.notify_all()
+            # the other frame is either free or being drawn, it can be captured into once it's drawn
+            self.back = self.frames[1] if frame is self.frames[0] else self.frames[0]
+            while self.drawing is self.back:
+                self.condition.wait()
+        return self.back
+
+    # the newest frame drawn since the last take, to be shown by the game (None if there's none)
+    # the frame isn't drawn on again before the game hands it off again
+    def take(self):
+        with self.condition:
+            frame = self.ready
+            self.ready = None
+        return frame
+
+    # wait until every frame handed off is drawn, then nothing is drawn until the next hand_off
+    # (show the message between two levels)
+    def wait(self):
+        with self.condition:
+            while (self.pending is not None or self.drawing is not None) and self.running:
+                self.condition.wait()
+
+    # stop the thread after the frame it's drawing, a frame that's waiting isn't drawn anymore
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.thread is not threading.current_thread():
+            self.thread.join()
@@ -0,0 +1,76 @@
+import contextlib
+import time
+
+import numpy as np
+
+# what NullProfiler.section hands out, entering and leaving it does nothing
+NULL_SECTION = contextlib.nullcontext()
+
+
+class NullProfiler:
+    """The profiler a Game has when nobody is measuring: every section is a no-op."""
+
+    def section(self, name):
+        return NULL_SECTION
+
+    def end_frame(self):
+        pass
+
+
+class Section:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.profiler.add(self.name, time.perf_counter() - self.start)
+
+
+class FrameProfiler:
+    """Measures how long each subsystem of a frame takes. The game wraps its subsystems in
+    `with profiler.section(name):`, a name can be entered more than once a frame (update and render of the clouds
+    are both 'clouds') and its times add up. end_frame() stores the total of every name for that frame,
+    0 for a name that didn't run, so every name has one sample per frame."""
+
+    def __init__(self):
+        # name -> list of seconds, one per finished frame
+        self.samples = {}
+        # name -> seconds so far in the current frame
+        self.current = {}
+        # name -> Section, a section is made once per name and reused every frame
+        self.sections = {}
+        self.frames = 0
+
+    def section(self, name):
+        section = self.sections.get(name)
+        if section is None:
+            section = self.sections[name] = Section(self, name)
+        return section
+
+    def add(self, name, seconds):
+        self.current[name] = self.current.get(name, 0) + seconds
+
+    def end_frame(self):
+        for name in self.current:
+            if name not in self.samples:
+                # a name seen for the first time didn't run in any of the frames before
+                self.samples[name] = [0.0] * self.frames
+        for name, samples in self.samples.items():
+            samples.append(self.current.get(name, 0.0))
+        self.current = {}
+        self.frames += 1
+
+    # milliseconds per frame of every name: mean, max and the given percentiles
+    def summary(self, percentiles=(50, 90, 99)):
+        result = {}
+        for name, samples in self.samples.items():
+            times = np.array(samples) * 1000
+            stats = {'mean': float(times.mean()), 'max': float(times.max())}
+            for percentile in percentiles:
+                stats['p' + str(percentile)] = float(np.percentile(times, percentile))
+            result[name] = stats
+        return result
@@ -0,0 +1,81 @@
+import numpy as np
+
+from scripts.container import ArrayPool
+
+# frames a projectile flies before it's removed (6 seconds)
+MAX_TIMER = 360
+
+
+class ProjectileSystem(ArrayPool):
+    """Every flying projectile in numpy arrays: position, direction (pixels per frame on X, negative is to the left)
+    and timer (frames since it was shot), one row per projectile, rows 0 to count - 1 are flying.
+    update() moves all of them at once and finds the ones that hit something without asking about every
+    projectile one by one: the tiles they're in are looked up in one go, in the few chunks they're in
+    (Tilemap.solid_cells), and only the projectiles inside the player's rect count as hitting the player.
+    Removed projectiles are swap removed."""
+
+    columns = ('pos', 'direction', 'timer')
+
+    def __init__(self, capacity=64):
+        super().__init__()
+        self.pos = np.zeros((capacity, 2))
+        self.direction = np.zeros(capacity)
+        self.timer = np.zeros(capacity, dtype=np.int64)
+
+    def spawn(self, pos, direction):
+        i = self.new_row()
+        self.pos[i] = pos
+        self.direction[i] = direction
+        self.timer[i] = 0
+
+    # move every projectile and remove the ones that hit a solid tile, the player (player_rect, None when the
+    # player can't be hit) or flew for too long
+    # returns what the game has to react to, in the order of the projectiles: a list of
+    # (pos, direction, hit_player) for every projectile that hit a tile (hit_player False) or the player (True)
+    def update(self, tilemap, player_rect=None):
+        count = self.count
+        if not count:
+            return []
+        pos = self.pos[:count]
+        direction = self.direction[:count]
+        timer = self.timer[:count]
+        pos[:, 0] += direction
+        timer += 1
+
+        # which tile every projectile is in, the same tile solid_check would look at
+        tiles = np.floor_divide(pos, tilemap.tile_size).astype(np.int64)
+        solid = tilemap.solid_cells(tiles[:, 0], tiles[:, 1])
+
+        expired = ~solid & (timer > MAX_TIMER)
+        if player_rect is not None:
+            # Rect.collidepoint cuts the point down to whole pixels (toward zero), so do we
+            x = np.trunc(pos[:, 0])
+            y = np.trunc(pos[:, 1])
+            hit_player = (~solid & ~expired & (x >= player_rect.left) & (x < player_rect.right)
+                          & (y >= player_rect.top) & (y < player_rect.bottom))
+        else:
+            hit_player = np.zeros(count, dtype=bool)
+
+        hits = []
+        for i in np.flatnonzero(solid | hit_player).tolist():
+            hits.append((pos[i].tolist(), float(direction[i]), bool(hit_player[i])))
+
+        self.remove_rows(solid | expired | hit_player)
+        return hits
+
+    # camera: only draw the projectiles it sees (see Camera.sees_points), all of them if None
+    # alpha: how far the time of the frame is from the last update to the next one (0 to 1), a projectile is drawn
+    # where it was that much of one update earlier, so it moves smoothly when frames are drawn between updates
+    def render(self, surf, img, offset=(0, 0), camera=None, alpha=1):
+        count = self.count
+        if not count:
+            return
+        pos = self.pos[:count]
+        if alpha != 1:
+            pos = pos.copy()
+            pos[:, 0] += self.direction[:count] * (alpha - 1)
+        if camera is not None:
+            pos = pos[camera.sees_points(pos)]
+        # when you subtract half of the width of something that just centers it
+        corners = pos - offset - (img.get_width() / 2, img.get_height() / 2)
+        surf.blits([(img, corner) for corner in corners.tolist()], doreturn=False)
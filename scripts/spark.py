@@ -1,31 +1,77 @@
 import math
 
+import numpy as np
 import pygame
 
+from scripts.container import ArrayPool
 
-class Spark:
-    def __init__(self, pos, angle, speed):
-        self.pos = list(pos)
-        self.angle = angle
-        self.speed = speed
+SPARK_COLOR = (255, 255, 255)
+
+
+# draw the polygons made by SparkSystem.polygons onto surf
+def draw_sparks(surf, polygons):
+    for points in polygons:
+        pygame.draw.polygon(surf, SPARK_COLOR, points)
+
+
+class SparkSystem(ArrayPool):
+    """Every spark of the game in numpy arrays: position, direction and speed, one row per spark,
+    rows 0 to count - 1 are alive. A spark flies in a straight line, so the direction (cos and sin of its angle)
+    is worked out once when it's spawned instead of every frame.
+    update() moves all sparks at once and slows them down, a spark is gone once its speed reaches 0
+    (swap remove: the last spark moves into its row). render() works out the 4 corners of every spark's
+    diamond in one go and then draws them."""
+
+    columns = ('pos', 'direction', 'speed')
+
+    def __init__(self, capacity=256):
+        super().__init__()
+        self.pos = np.zeros((capacity, 2))
+        # (cos(angle), sin(angle)) of every spark
+        self.direction = np.zeros((capacity, 2))
+        self.speed = np.zeros(capacity)
+
+    def spawn(self, pos, angle, speed):
+        i = self.new_row()
+        self.pos[i] = pos
+        self.direction[i] = (math.cos(angle), math.sin(angle))
+        self.speed[i] = speed
 
     def update(self):
-        self.pos[0] += math.cos(self.angle) * self.speed
-        self.pos[1] += math.sin(self.angle) * self.speed
-
-        self.speed = max(0, self.speed - 0.1)
-        return not self.speed
-
-    def render(self, surf, offset=(0, 0)):
-        render_points = [
-            (self.pos[0] + math.cos(self.angle) * self.speed * 3 - offset[0],
-             self.pos[1] + math.sin(self.angle) * self.speed * 3 - offset[1]),
-            (self.pos[0] + math.cos(self.angle + math.pi * 0.5) * self.speed * 0.5 - offset[0],
-             self.pos[1] + math.sin(self.angle + math.pi * 0.5) * self.speed * 0.5 - offset[1]),
-            (self.pos[0] + math.cos(self.angle + math.pi) * self.speed * 3 - offset[0],
-             self.pos[1] + math.sin(self.angle + math.pi) * self.speed * 3 - offset[1]),
-            (self.pos[0] + math.cos(self.angle - math.pi * 0.5) * self.speed * 0.5 - offset[0],
-             self.pos[1] + math.sin(self.angle - math.pi * 0.5) * self.speed * 0.5 - offset[1]),
-        ]
-
-        pygame.draw.polygon(surf, (255, 255, 255), render_points)
\ No newline at end of file
+        count = self.count
+        if not count:
+            return
+        speed = self.speed[:count]
+        self.pos[:count] += self.direction[:count] * speed[:, None]
+        np.maximum(speed - 0.1, 0, out=speed)
+
+        self.remove_rows(speed == 0)
+
+    # camera: only draw the sparks it sees (see Camera.sees_points), all of them if None
+    # alpha: how far the time of the frame is from the last update to the next one (0 to 1), see
+    # ProjectileSystem.render
+    def render(self, surf, offset=(0, 0), camera=None, alpha=1):
+        draw_sparks(surf, self.polygons(offset, camera, alpha))
+
+    # the diamond of every spark render draws, a list of 4 (x, y) points each, in screen pixel
+    # it's plain lists made for this call, so it can be drawn later while the sparks keep moving (see Frame)
+    def polygons(self, offset=(0, 0), camera=None, alpha=1):
+        count = self.count
+        if not count:
+            return []
+        pos = self.pos[:count]
+        speed = self.speed[:count, None]
+        direction = self.direction[:count]
+        if alpha != 1:
+            pos = pos + direction * speed * (alpha - 1)
+        if camera is not None:
+            visible = camera.sees_points(pos)
+            pos = pos[visible]
+            speed = speed[visible]
+            direction = direction[visible]
+        center = pos - offset
+        # a spark is a diamond: long (3 times its speed) along its direction and thin (half its speed) across it
+        front = direction * speed * 3
+        side = direction[:, ::-1] * (-1, 1) * speed * 0.5
+        points = np.stack((center + front, center + side, center - front, center - side), axis=1)
+        return points.tolist()
@@ -0,0 +1,89 @@
+class SpatialHash:
+    """Buckets items by the cells of a coarse grid (cell_size pixels wide) that their rect touches.
+    Finding what's inside a rect or under a point only looks at the few buckets that rect/point covers,
+    so the cost of a query depends on how crowded that spot is, not on how many items there are in total.
+    Items come back in the order they were added, which is also the order they should be drawn in."""
+
+    def __init__(self, cell_size=64):
+        self.cell_size = cell_size
+        self.clear()
+
+    def clear(self):
+        # (cell_x, cell_y) -> set of serial numbers of the items touching that cell
+        self.cells = {}
+        # serial number -> (item, rect), a serial number only goes up so a dict keeps them in insertion order
+        self.entries = {}
+        # id(item) -> serial number, so an item (which can be an unhashable dict) can be removed again
+        self.serials = {}
+        self.next_serial = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    # iterate over a snapshot, so items can be removed while looping
+    def __iter__(self):
+        return iter([item for item, rect in self.entries.values()])
+
+    def __contains__(self, item):
+        return id(item) in self.serials
+
+    # every cell touched by rect=(x, y, width, height), x and y can be floats
+    def _cells(self, rect):
+        cell_size = self.cell_size
+        for cell_x in range(int(rect[0] // cell_size), int((rect[0] + rect[2]) // cell_size) + 1):
+            for cell_y in range(int(rect[1] // cell_size), int((rect[1] + rect[3]) // cell_size) + 1):
+                yield cell_x, cell_y
+
+    def add(self, item, rect):
+        serial = self.next_serial
+        self.next_serial += 1
+        self.entries[serial] = (item, tuple(rect))
+        self.serials[id(item)] = serial
+        for cell in self._cells(rect):
+            if cell not in self.cells:
+                self.cells[cell] = set()
+            self.cells[cell].add(serial)
+
+    # remove the item, return True if it was in the index
+    def remove(self, item):
+        serial = self.serials.pop(id(item), None)
+        if serial is None:
+            return False
+        item, rect = self.entries.pop(serial)
+        for cell in self._cells(rect):
+            bucket = self.cells[cell]
+            bucket.discard(serial)
+            if not bucket:
+                del self.cells[cell]
+        return True
+
+    def _candidates(self, rect):
+        found = set()
+        for cell in self._cells(rect):
+            bucket = self.cells.get(cell)
+            if bucket:
+                found |= bucket
+        return sorted(found)
+
+    # every item whose rect overlaps rect=(x, y, width, height), in insertion order
+    def query(self, rect):
+        x, y, w, h = rect
+        matches = []
+        for serial in self._candidates(rect):
+            item, item_rect = self.entries[serial]
+            # the buckets are coarse, so check the real rect too
+            if item_rect[0] < x + w and x < item_rect[0] + item_rect[2] and item_rect[1] < y + h and y < item_rect[1] + item_rect[3]:
+                matches.append(item)
+        return matches
+
+    # every item whose rect contains the point pos=(x, y), in insertion order
+    def query_point(self, pos):
+        matches = []
+        bucket = self.cells.get((int(pos[0] // self.cell_size), int(pos[1] // self.cell_size)))
+        if not bucket:
+            return matches
+        for serial in sorted(bucket):
+            item, rect = self.entries[serial]
+            if rect[0] <= pos[0] < rect[0] + rect[2] and rect[1] <= pos[1] < rect[1] + rect[3]:
+                matches.append(item)
+        return matches
@@ -0,0 +1,78 @@
+import queue
+import threading
+
+from scripts.chunk import CHUNK_SHIFT
+
+
+class ChunkStreamer:
+    """Keeps the chunks of a binary map that are around the camera in memory and lets the rest go.
+    update() is called once a frame with the camera center: chunks within radius (in chunks) that aren't decoded yet
+    are handed to a background thread, nearest first, and when more than max_chunks are in memory the ones
+    furthest from the camera are dropped again (they can be decoded again from the memory mapped file any time).
+    Chunks that were edited since they were decoded are never dropped, the file doesn't have those edits.
+    Anything that needs a chunk the thread hasn't got to yet (physics, solid_check, render) decodes it right away
+    through Tilemap.load_chunk, which waits for the thread if it's decoding that same chunk, so nothing ever sees
+    a chunk as empty just because it wasn't streamed in yet."""
+
+    def __init__(self, tilemap, radius=2, max_chunks=1024):
+        self.tilemap = tilemap
+        self.radius = radius
+        # never go below what the camera needs, otherwise we'd drop chunks only to decode them next frame
+        self.max_chunks = max(max_chunks, (2 * radius + 1) ** 2)
+        # offsets of the chunks around the camera, nearest first, so the thread fetches what we need soonest first
+        self.offsets = sorted(((dx, dy) for dx in range(-radius, radius + 1) for dy in range(-radius, radius + 1)),
+                              key=lambda offset: offset[0] ** 2 + offset[1] ** 2)
+        self.requests = queue.Queue()
+        # keys already queued, so the same chunk isn't queued again every frame until the thread gets to it
+        self.requested = set()
+        self.prefetched = 0
+        self.evicted = 0
+        self.thread = threading.Thread(target=self.work, daemon=True)
+        self.thread.start()
+
+    def work(self):
+        while True:
+            key = self.requests.get()
+            # None is the signal to stop
+            if key is None:
+                return
+            if self.tilemap.load_chunk(key) is not None:
+                self.prefetched += 1
+            self.requested.discard(key)
+
+    def stop(self):
+        self.requests.put(None)
+        self.thread.join()
+
+    # center is the camera center in pixel
+    def update(self, center):
+        tilemap = self.tilemap
+        chunk_pixels = tilemap.tile_size << CHUNK_SHIFT
+        center_x = int(center[0] // chunk_pixels)
+        center_y = int(center[1] // chunk_pixels)
+
+        lazy_chunks = tilemap.lazy_chunks
+        for offset in self.offsets:
+            key = (center_x + offset[0], center_y + offset[1])
+            if key in lazy_chunks and key not in self.requested:
+                self.requested.add(key)
+                self.requests.put(key)
+
+        if len(tilemap.chunks) > self.max_chunks:
+            self.evict(center_x, center_y)
+
+    def evict(self, center_x, center_y):
+        tilemap = self.tilemap
+        toc = tilemap.source.toc
+        with tilemap.lock:
+            # only chunks that are still exactly what's in the file (version 0) and outside the camera radius
+            candidates = [key for key, chunk in tilemap.chunks.items()
+                          if not chunk.version and key in toc
+                          and max(abs(key[0] - center_x), abs(key[1] - center_y)) > self.radius]
+            candidates.sort(key=lambda key: (key[0] - center_x) ** 2 + (key[1] - center_y) ** 2, reverse=True)
+            dropped = candidates[:len(tilemap.chunks) - self.max_chunks]
+            for key in dropped:
+                # back in the not decoded yet list, so the next lookup decodes it from the file again, and everything
+                # that was built from it goes too, or the memory wouldn't really be given back
+                tilemap.unload_chunk(key)
+                self.evicted += 1
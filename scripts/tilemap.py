@@ -1,6 +1,17 @@
 import json
+import threading
+from array import array
+
+import numpy as np
 import pygame
 
+from scripts.chunk import CHUNK_SHIFT, CHUNK_SIZE, CHUNK_MASK, EMPTY, Chunk
+from scripts.chunk_cache import ChunkRenderCache
+from scripts.collision import CollisionLayer, SolidLookup
+from scripts.mapformat import BinaryMap, is_binary_map, save_binary
+from scripts.spatial import SpatialHash
+from scripts.streaming import ChunkStreamer
+
 # tips and trick from tutor
 # rule for auto tile
 AUTOTILE_MAP = {
@@ -31,13 +42,193 @@ NEIGHBOR_OFFSETS = [(-1, 0), (-1, -1), (0, -1), (1, -1), (1, 0), (0, 0), (-1, 1)
 PHYSIC_TILES = {'grass', 'stone'}  # this is a set using this is more optimized
 AUTOTILE_TYPES = {'grass', 'stone'}
 
+# the 4 neighbours autotile looks at, neighbour i being the same type sets bit i of a tile's neighbour mask
+AUTOTILE_SHIFTS = [(1, 0), (-1, 0), (0, -1), (0, 1)]
+# AUTOTILE_MAP as a lookup table: AUTOTILE_LUT[mask] is the variant for that neighbour mask, -1 if there's no rule
+AUTOTILE_LUT = np.full(1 << len(AUTOTILE_SHIFTS), -1, dtype=np.int16)
+for mask in range(len(AUTOTILE_LUT)):
+    neighbors = tuple(sorted(shift for i, shift in enumerate(AUTOTILE_SHIFTS) if mask & (1 << i)))
+    if neighbors in AUTOTILE_MAP:
+        AUTOTILE_LUT[mask] = AUTOTILE_MAP[neighbors]
+
 
 class Tilemap:
     def __init__(self, game, tile_size=16):
         self.game = game
         self.tile_size = tile_size
-        self.tilemap = {}
-        self.offgrid_tiles = []
+        # every chunk drawn onto its own surface, so render blits a few chunks instead of every tile
+        self.render_cache = ChunkRenderCache(self)
+        # solid tiles merged into bigger rects, what physics_rects_around hands out
+        self.collision = CollisionLayer(self, NEIGHBOR_OFFSETS)
+        # the memory mapped binary map chunks are decoded from, None when the map came from json
+        self.source = None
+        # streams chunks of the binary map in and out around the camera, None when we're not streaming
+        self.streamer = None
+        # chunks can be decoded by the streaming thread and by the game at the same time
+        self.lock = threading.RLock()
+        self.clear()
+
+    # forget every tile and every tile id
+    def clear(self):
+        # (chunk_x, chunk_y) -> Chunk, chunks with no tile in them are not stored at all
+        self.chunks = {}
+        # (chunk_x, chunk_y) -> offset in self.source of the chunks that haven't been decoded yet
+        self.lazy_chunks = {}
+        self.stop_streaming()
+        self.close_source()
+        # off grid tiles bucketed by where they are, so rendering and hit tests only look at the nearby ones
+        self.offgrid_tiles = SpatialHash(cell_size=64)
+        # palette[tile id] is the (type, variant) pair of that id, id 0 is reserved for empty cells
+        self.palette = [None]
+        self.palette_ids = {}
+        # solid_ids[tile id] is 1 if that id is a physic tile, indexing a bytearray is cheaper than a set lookup
+        self.solid_ids = bytearray(1)
+        self.render_cache.clear()
+        self.collision.clear()
+        self.lookup_cache = None
+
+    # give every (type, variant) pair a small integer id, the same pair always gets the same id
+    def tile_id(self, tile_type, variant):
+        key = (tile_type, variant)
+        if key not in self.palette_ids:
+            self.palette_ids[key] = len(self.palette)
+            self.palette.append(key)
+            self.solid_ids.append(1 if tile_type in PHYSIC_TILES else 0)
+        return self.palette_ids[key]
+
+    def close_source(self):
+        with self.lock:
+            if self.source is not None:
+                self.source.close()
+                self.source = None
+
+    # keep only the chunks within radius (in chunks) of the camera in memory, at most max_chunks of them
+    # only works for binary maps, they're the only ones we can decode a single chunk from
+    def start_streaming(self, radius=2, max_chunks=1024):
+        if self.source is None or self.streamer is not None:
+            return False
+        self.streamer = ChunkStreamer(self, radius=radius, max_chunks=max_chunks)
+        return True
+
+    def stop_streaming(self):
+        if self.streamer is not None:
+            self.streamer.stop()
+            self.streamer = None
+            if not self.lazy_chunks:
+                self.close_source()
+
+    # call once a frame with the camera center in pixel, does nothing when we're not streaming
+    def update_streaming(self, center):
+        if self.streamer is not None:
+            self.streamer.update(center)
+
+    # decode the chunk at key from the binary map if it hasn't been yet, return None if there's no such chunk
+    def load_chunk(self, key):
+        with self.lock:
+            offset = self.lazy_chunks.pop(key, None)
+            if offset is None:
+                return self.chunks.get(key)
+            # None when extract took every tile of that chunk out
+            chunk = self.source.read_chunk(offset)
+            if chunk is not None:
+                self.chunks[key] = chunk
+            # once everything has been decoded we don't need the file anymore
+            # (unless we're streaming, then chunks get dropped and decoded again)
+            if not self.lazy_chunks and self.streamer is None:
+                self.close_source()
+            return chunk
+
+    def load_all_chunks(self):
+        for key in list(self.lazy_chunks):
+            self.load_chunk(key)
+
+    # forget the decoded chunk at key, and everything that was built from it, the next lookup decodes it again
+    # only for a chunk that's still what the binary map has (version 0), the file doesn't have any edit
+    def unload_chunk(self, key):
+        with self.lock:
+            del self.chunks[key]
+            self.lazy_chunks[key] = self.source.toc[key]
+            self.render_cache.drop(key)
+            self.collision.drop(key)
+            # the solid lookup can hold that chunk too
+            self.lookup_cache = None
+
+    # return the chunk at key=(chunk_x, chunk_y), None if there are no tiles in it
+    def chunk_at(self, key):
+        chunk = self.chunks.get(key)
+        # only when the lookup misses do we pay for checking the chunks that haven't been decoded
+        if chunk is None and self.lazy_chunks:
+            return self.load_chunk(key)
+        return chunk
+
+    # return the tile id at tile coordinate (x, y), 0 if the cell is empty
+    def get_tile(self, x, y):
+        chunk = self.chunk_at((x >> CHUNK_SHIFT, y >> CHUNK_SHIFT))
+        if chunk is None:
+            return EMPTY
+        return chunk.tiles[((y & CHUNK_MASK) << CHUNK_SHIFT) | (x & CHUNK_MASK)]
+
+    # place a tile at grid position pos=(x, y), replacing whatever was there
+    def set_tile(self, pos, tile_type, variant):
+        self._set_id(pos[0], pos[1], self.tile_id(tile_type, variant))
+
+    # delete the tile at grid position pos=(x, y), return True if there was one
+    def remove_tile(self, pos):
+        if self.get_tile(pos[0], pos[1]) == EMPTY:
+            return False
+        self._set_id(pos[0], pos[1], EMPTY)
+        return True
+
+    def _set_id(self, x, y, tile_id):
+        key = (x >> CHUNK_SHIFT, y >> CHUNK_SHIFT)
+        chunk = self.chunk_at(key)
+        if chunk is None:
+            if tile_id == EMPTY:
+                return
+            chunk = self.chunks[key] = Chunk()
+        index = ((y & CHUNK_MASK) << CHUNK_SHIFT) | (x & CHUNK_MASK)
+        old_id = chunk.tiles[index]
+        if old_id == tile_id:
+            return
+        chunk.tiles[index] = tile_id
+        chunk.count += (tile_id != EMPTY) - (old_id != EMPTY)
+        chunk.version += 1
+        self.collision.invalidate(key)
+        self.lookup_cache = None
+        if not chunk.count:
+            del self.chunks[key]
+            # nothing will look up the baked surface of a chunk that's gone, so it wouldn't be replaced either
+            self.render_cache.drop(key)
+
+    # go through every tile on the grid, yield (x, y, tile id) in tile coordinate
+    def iter_tiles(self):
+        self.load_all_chunks()
+        for (cx, cy), chunk in list(self.chunks.items()):
+            base_x = cx << CHUNK_SHIFT
+            base_y = cy << CHUNK_SHIFT
+            for index, tile_id in enumerate(chunk.tiles):
+                if tile_id:
+                    yield base_x + (index & CHUNK_MASK), base_y + (index >> CHUNK_SHIFT), tile_id
+
+    # build the same dict the old string keyed tilemap stored, only used by code that wants a tile "object"
+    def tile_dict(self, x, y, tile_id):
+        tile_type, variant = self.palette[tile_id]
+        return {'type': tile_type, 'variant': variant, 'pos': [x, y]}
+
+    # add a tile that isn't snapped to the grid, tile['pos'] is in pixel
+    def add_offgrid(self, tile):
+        images = self.game.assets.get(tile['type'])
+        # the game doesn't load every tile image (spawners are taken out of the map before anything is drawn)
+        # so fall back to the size of a grid tile when we don't know how big the image is
+        size = images[tile['variant']].get_size() if images else (self.tile_size, self.tile_size)
+        self.offgrid_tiles.add(tile, (tile['pos'][0], tile['pos'][1], size[0], size[1]))
+
+    def remove_offgrid(self, tile):
+        return self.offgrid_tiles.remove(tile)
+
+    # every off grid tile under the pixel position pos, in the order they are drawn
+    def offgrid_at(self, pos):
+        return self.offgrid_tiles.query_point(pos)
 
     # function to get specific location of the tile we are trying to find
     # our tiles are in tile type format along with tile variant, those 2 go together to uniquely indentify the tile type
@@ -46,31 +237,56 @@ class Tilemap:
 
     def extract(self, id_pairs, keep=False):
         matches = []
-        # why use copy() ? because we might want to delete that tile from the list if we're not keeping it
-        for tile in self.offgrid_tiles.copy():
+        # iterating the index gives a copy, because we might want to delete that tile if we're not keeping it
+        for tile in self.offgrid_tiles:
             # if found the id_pair we're looking for, it will give us that tile information
             if (tile['type'], tile['variant']) in id_pairs:
                 matches.append(tile.copy())
                 # if we don't want to keep that tile then we will remove it from off grid tile
                 if not keep:
-                    self.offgrid_tiles.remove(tile)
+                    self.remove_offgrid(tile)
 
-        for loc in self.tilemap:
-            tile = self.tilemap[loc]
-            if (tile['type'], tile['variant']) in id_pairs:
-                matches.append(tile.copy())
-                # we're changing the position for the tile we're referencing because we want it to be in pixel
-                # because the tile map is in tile coordinate for the grid not in pixel
-                # why we use copy() again because we want to work with the copy of that tile not that exact tile
-                matches[-1]['pos'] = matches[-1]['pos'].copy()
-                matches[-1]['pos'][0] *= self.tile_size
-                matches[-1]['pos'][1] *= self.tile_size
-                if not keep:
-                    del self.tilemap[loc]
+        # turn the pairs into tile ids once, wanted[tile id] is True for the ids we're looking for
+        ids = [self.palette_ids[pair] for pair in map(tuple, id_pairs) if pair in self.palette_ids]
+        if not ids:
+            return matches
+        wanted = np.zeros(len(self.palette), dtype=bool)
+        wanted[ids] = True
+        with self.lock:
+            source = self.source
+            # a binary map's chunks are gone through in order of position, so the matches come in the same order
+            # whichever chunks the streamer has decoded already
+            keys = list(self.chunks) if source is None else sorted(set(self.chunks) | set(self.lazy_chunks))
+            for key in keys:
+                chunk = self.chunks.get(key)
+                if chunk is not None:
+                    found = np.flatnonzero(wanted[np.frombuffer(chunk.tiles, dtype=np.uint16)])
+                    cells = [(index, chunk.tiles[index]) for index in found.tolist()]
+                else:
+                    # not decoded yet, look at the file data: decoding would keep every chunk of the map in memory
+                    cells = source.find_tiles(self.lazy_chunks[key], wanted)
+                # a decoded chunk that's still what's in the file isn't edited, it's decoded again without the tiles
+                # we take out (erase below): an edited chunk could never be dropped by the streamer again
+                unedited = chunk is not None and source is not None and not chunk.version and key in source.toc
+                base_x = key[0] << CHUNK_SHIFT
+                base_y = key[1] << CHUNK_SHIFT
+                for index, tile_id in cells:
+                    x = base_x + (index & CHUNK_MASK)
+                    y = base_y + (index >> CHUNK_SHIFT)
+                    matches.append(self.tile_dict(x, y, tile_id))
+                    # we're changing the position for the tile because we want it to be in pixel
+                    # because the tile map is in tile coordinate for the grid not in pixel
+                    matches[-1]['pos'][0] *= self.tile_size
+                    matches[-1]['pos'][1] *= self.tile_size
+                    if not keep and chunk is not None and not unedited:
+                        self._set_id(x, y, EMPTY)
+                if not keep and cells and unedited:
+                    self.unload_chunk(key)
+            if not keep and source is not None:
+                # the chunks that aren't decoded yet (or get dropped and decoded again) lose these tiles too
+                source.erase(ids)
         return matches
 
-
-
     # function to convert pixel position to grid position
     def tiles_around(self, pos):
         tiles = []
@@ -93,91 +309,218 @@ class Tilemap:
         tile_loc = (int(pos[0] // self.tile_size), int(pos[1] // self.tile_size))
         for offset in NEIGHBOR_OFFSETS:
             # left to right X-axis and Y-axis
-            check_loc = str(tile_loc[0] + offset[0]) + ';' + str(tile_loc[1] + offset[1])
+            x = tile_loc[0] + offset[0]
+            y = tile_loc[1] + offset[1]
+            tile_id = self.get_tile(x, y)
             # Check if a tile is actually there because in a tile map there's alot of empty space
-            if check_loc in self.tilemap:
-                tiles.append(self.tilemap[check_loc])
+            if tile_id:
+                tiles.append(self.tile_dict(x, y, tile_id))
         return tiles  # Return all the tiles around that location
 
     def save(self, path):
+        # a .map path gets the compact binary format, anything else the json one
+        if path.endswith('.map'):
+            save_binary(self, path)
+            return
+        # the json format is still the "x;y" keyed json, so old maps and new maps are interchangeable
+        tilemap = {}
+        for x, y, tile_id in self.iter_tiles():
+            tilemap[str(x) + ';' + str(y)] = self.tile_dict(x, y, tile_id)
         f = open(path, 'w')
-        json.dump({'tilemap': self.tilemap, 'tile_size': self.tile_size, 'offgrid': self.offgrid_tiles}, f)
+        json.dump({'tilemap': tilemap, 'tile_size': self.tile_size, 'offgrid': list(self.offgrid_tiles)}, f)
         f.close()
 
     def load(self, path):
+        if is_binary_map(path):
+            self.load_binary(path)
+            return
         f = open(path, 'r')
         map_data = json.load(f)
         f.close()
 
-        self.tilemap = map_data['tilemap']
+        self.clear()
         self.tile_size = map_data['tile_size']
-        self.offgrid_tiles = map_data['offgrid']
+        for tile in map_data['tilemap'].values():
+            self.set_tile(tile['pos'], tile['type'], tile['variant'])
+        for tile in map_data['offgrid']:
+            self.add_offgrid(tile)
+
+    # open a binary map, only the palette and off grid tiles are read now, chunks get decoded the first time
+    # something looks at them
+    def load_binary(self, path):
+        source = BinaryMap(path)
+        self.clear()
+        self.tile_size = source.tile_size
+        # register the palette in file order, so the tile ids stored in the file are our tile ids too
+        for tile_type, variant in source.palette:
+            self.tile_id(tile_type, variant)
+        for tile in source.offgrid:
+            self.add_offgrid(tile)
+        self.source = source
+        # a copy, the streamer needs the full table of contents to decode dropped chunks again
+        self.lazy_chunks = dict(source.toc)
+        if not self.lazy_chunks:
+            self.close_source()
 
     def solid_check(self, pos):
         # convert pixel into the coordinate of the grid
-        tile_loc = str(int(pos[0] // self.tile_size)) + ';' + str(int(pos[1] // self.tile_size))
+        x = int(pos[0] // self.tile_size)
+        y = int(pos[1] // self.tile_size)
+        key = (x >> CHUNK_SHIFT, y >> CHUNK_SHIFT)
+        chunk = self.chunks.get(key)
+        if chunk is None and self.lazy_chunks:
+            chunk = self.load_chunk(key)
         # if this location exists
-        if tile_loc in self.tilemap:
+        if chunk is not None:
+            tile_id = chunk.tiles[((y & CHUNK_MASK) << CHUNK_SHIFT) | (x & CHUNK_MASK)]
             # if this is a physic tile (grass, stone)
-            if self.tilemap[tile_loc]['type'] in PHYSIC_TILES:
-                # then return that tile data
+            if self.solid_ids[tile_id]:
+                # then return the (type, variant) pair of that tile
                 # in our case we're not going to use the tile, just need to check if the tile exists
-                return self.tilemap[tile_loc]
+                return self.palette[tile_id]
 
+    # the solid rects around pos, the solid tiles are merged into bigger rects ahead of time by the collision layer
+    # the tuple and the rects in it are shared by every caller, so don't change them
     def physics_rects_around(self, pos):
-        rects = []  # rectangle that are going to be returned
-        for tile in self.tiles_around(pos):  # Get all the nearby tiles
-            if tile['type'] in PHYSIC_TILES:
-                # pygame.rect(left, top, width, height)
-                rects.append(
-                    pygame.Rect(tile['pos'][0] * self.tile_size, tile['pos'][1] * self.tile_size, self.tile_size,
-                                self.tile_size))
-        return rects
+        return self.collision.rects_around(pos)
+
+    # the tile id of every cell in the box around all chunks as one numpy array, ids[y, x]
+    # returns the array and the tile position of ids[0, 0]
+    def id_grid(self):
+        self.load_all_chunks()
+        if not self.chunks:
+            return np.zeros((0, 0), dtype=np.uint16), (0, 0)
+        keys = list(self.chunks)
+        min_cx = min(key[0] for key in keys)
+        min_cy = min(key[1] for key in keys)
+        ids = np.zeros(((max(key[1] for key in keys) - min_cy + 1) * CHUNK_SIZE,
+                        (max(key[0] for key in keys) - min_cx + 1) * CHUNK_SIZE), dtype=np.uint16)
+        for key in keys:
+            x = (key[0] - min_cx) * CHUNK_SIZE
+            y = (key[1] - min_cy) * CHUNK_SIZE
+            ids[y:y + CHUNK_SIZE, x:x + CHUNK_SIZE] = np.frombuffer(self.chunks[key].tiles, dtype=np.uint16).reshape(
+                CHUNK_SIZE, CHUNK_SIZE)
+        return ids, (min_cx << CHUNK_SHIFT, min_cy << CHUNK_SHIFT)
+
+    # whether the tiles at the integer numpy arrays of tile positions x and y are physic tiles
+    # only the chunks those tiles are in are looked at. cached goes through solid_lookup, for tiles next to the
+    # entities of the batched physics (the ground in front of the enemies, Enemy.begin_batch), otherwise nothing
+    # is kept: that's for the projectiles (ProjectileSystem), a few tiles somewhere different every frame
+    def solid_cells(self, x, y, cached=False):
+        keys = frozenset(zip((x >> CHUNK_SHIFT).tolist(), (y >> CHUNK_SHIFT).tolist()))
+        lookup = self.solid_lookup(keys) if cached else SolidLookup(self, keys)
+        return lookup.cells(x, y)
+
+    # which cells of the chunks in keys (a frozenset of chunk keys) are physic tiles, see SolidLookup
+    # the last one is kept and handed out again as long as it has all the chunks asked for and no tile changed,
+    # it's what the batched physics (PhysicsWorld) collides against
+    def solid_lookup(self, keys):
+        cache = self.lookup_cache
+        if cache is None or not keys <= cache.keys:
+            # the physics and the enemies' ground checks ask for a few different chunks every frame, the new lookup
+            # keeps the old one's chunks too so it has all of them, unless the entities have moved on and most of
+            # those aren't needed anymore
+            if cache is not None and len(keys | cache.keys) <= 2 * len(keys):
+                keys = keys | cache.keys
+            self.lookup_cache = SolidLookup(self, keys)
+        return self.lookup_cache
+
+    # the variant autotile picks for the tile at (x, y), None if autotile leaves it alone
+    def autotile_variant(self, x, y, tile_id):
+        tile_type = self.palette[tile_id][0]
+        if tile_type not in AUTOTILE_TYPES:
+            return None
+        neighbors = set()
+        for shift in AUTOTILE_SHIFTS:
+            check_id = self.get_tile(x + shift[0], y + shift[1])
+            # check if the neighbour tile is the same type as the tile itself
+            # if  not then don't auto tile
+            if check_id and self.palette[check_id][0] == tile_type:
+                neighbors.add(shift)
+        return AUTOTILE_MAP.get(tuple(sorted(neighbors)))
+
+    # autotile only around the cells that were edited, cells is a collection of (x, y) tile positions
+    # a tile's variant only depends on its neighbours, so only the 3x3 block around each edited cell can change
+    def autotile_cells(self, cells):
+        check = set()
+        for x, y in cells:
+            for offset in NEIGHBOR_OFFSETS:
+                check.add((x + offset[0], y + offset[1]))
+        changes = []
+        for x, y in check:
+            tile_id = self.get_tile(x, y)
+            if tile_id:
+                variant = self.autotile_variant(x, y, tile_id)
+                if variant is not None:
+                    changes.append((x, y, self.tile_id(self.palette[tile_id][0], variant)))
+        # neighbours only care about the type, so it's safe to apply the new variants after the scan
+        for x, y, tile_id in changes:
+            self._set_id(x, y, tile_id)
 
     # function that auto put corresponding tile from current tile
+    # this is the whole map version, it works on numpy arrays of the whole map at once instead of tile by tile
     def autotile(self):
-        for loc in self.tilemap:
-            tile = self.tilemap[loc]
-            neighbors = set()
-            for shift in [(1, 0), (-1, 0), (0, -1), (0, 1)]:
-                check_loc = str(tile['pos'][0] + shift[0]) + ';' + str(tile['pos'][1] + shift[1])
-                if check_loc in self.tilemap:
-                    # check if the neighbour tile is the same type as the tile itself
-                    # if  not then don't auto tile
-                    if self.tilemap[check_loc]['type'] == tile['type']:
-                        neighbors.add(shift)
-            neighbors = tuple(sorted(neighbors))
-            if (tile['type'] in AUTOTILE_TYPES) and (neighbors in AUTOTILE_MAP):
-                tile['variant'] = AUTOTILE_MAP[neighbors]
+        ids, origin = self.id_grid()
+        if not ids.size:
+            return
+        keys = list(self.chunks)
+        min_cx = origin[0] >> CHUNK_SHIFT
+        min_cy = origin[1] >> CHUNK_SHIFT
+        height, width = ids.shape
+        # a ring of empty cells around the map, so looking one cell to the side never falls off the array
+        ids = np.pad(ids, 1)
+
+        # tile id -> index of its type (0 for empty), neighbours have the same type if they have the same index
+        type_names = sorted({pair[0] for pair in self.palette[1:]})
+        type_of_id = np.array([0] + [type_names.index(pair[0]) + 1 for pair in self.palette[1:]], dtype=np.int16)
+        types = type_of_id[ids]
+        center = types[1:-1, 1:-1]
+
+        # build the neighbour mask of every cell, one shifted view of the array per neighbour
+        mask = np.zeros(center.shape, dtype=np.uint8)
+        for i, shift in enumerate(AUTOTILE_SHIFTS):
+            neighbor = types[1 + shift[1]:height + 1 + shift[1], 1 + shift[0]:width + 1 + shift[0]]
+            mask |= ((neighbor == center) & (center != 0)).astype(np.uint8) << i
+        variants = AUTOTILE_LUT[mask]
+
+        # a cell changes if it's an autotile type and its mask has a rule
+        autotile_type = np.array([False] + [name in AUTOTILE_TYPES for name in type_names])
+        changed = autotile_type[center] & (variants >= 0)
+        new_ids = ids[1:-1, 1:-1].copy()
+        for type_index in np.unique(center[changed]):
+            for variant in np.unique(variants[changed & (center == type_index)]):
+                cells = changed & (center == type_index) & (variants == variant)
+                new_ids[cells] = self.tile_id(type_names[type_index - 1], int(variant))
+
+        # write the chunks that changed back, only their version is bumped so only they are baked again
+        for key in keys:
+            x = (key[0] - min_cx) * CHUNK_SIZE
+            y = (key[1] - min_cy) * CHUNK_SIZE
+            chunk = self.chunks[key]
+            tiles = new_ids[y:y + CHUNK_SIZE, x:x + CHUNK_SIZE].tobytes()
+            if tiles != chunk.tiles.tobytes():
+                chunk.tiles = array('H')
+                chunk.tiles.frombytes(tiles)
+                chunk.version += 1
+                self.collision.invalidate(key)
 
     def render(self, surf, offset=(0, 0)):
         # Off grid tile are mostly for decoration so put them before real tile
         # why do this is because you don't want to run into some decoration and get stopped by it
-        """Off grid tile can be optimized too, you can learn about it if you interest in it"""
-        for tile in self.offgrid_tiles:
-            surf.blit(self.game.assets[tile['type']][tile['variant']],
-                      (tile['pos'][0] - offset[0], tile['pos'][1] - offset[1]))
-
-        """This loop iterates over a range of x and y coordinates that correspond to the visible area of the surface 
-        (surf), adjusted by the camera offset (offset).
-        The // operator performs floor division, 
-        ensuring that the coordinates are aligned with the tile grid based on the self.tile_size."""
-        for x in range(offset[0] // self.tile_size, (offset[0] + surf.get_width()) // self.tile_size + 1):
-            for y in range(offset[1] // self.tile_size, (offset[1] + surf.get_height()) // self.tile_size + 1):
-                """For each x and y coordinate pair, a string - representation of the coordinates - is created (loc) 
-                to identify the tile's position in the tilemap.
-                This string concatenation (str(x) + ';' + str(y)) creates a unique identifier 
-                for each tile position, typically in the format "x;y"."""
-                loc = str(x) + ';' + str(y)
-                # check if loc exist in self.tilemap, ensuring a tile is defined for that position
-                if loc in self.tilemap:
-                    tile = self.tilemap[loc]
-                    surf.blit(self.game.assets[tile['type']][tile['variant']],
-                              (
-                              tile['pos'][0] * self.tile_size - offset[0], tile['pos'][1] * self.tile_size - offset[1]))
-
-        # These are tiles that you are going to run into
-        # for loc in self.tilemap:
-        #    tile = self.tilemap[loc]
-        #    surf.blit(self.game.assets[tile['type']][tile['variant']],
-        #              (tile['pos'][0] * self.tile_size - offset[0], tile['pos'][1] * self.tile_size - offset[1]))
+        # only the off grid tiles that overlap the camera view are drawn
+        assets = self.game.assets
+        surf.blits([(assets[tile['type']][tile['variant']], (tile['pos'][0] - offset[0], tile['pos'][1] - offset[1]))
+                    for tile in self.offgrid_tiles.query((offset[0], offset[1], surf.get_width(), surf.get_height()))],
+                   doreturn=False)
+
+        """The visible area of the surface (surf), adjusted by the camera offset (offset), covers a range of tiles.
+        The // operator performs floor division,
+        ensuring that the coordinates are aligned with the tile grid based on the self.tile_size.
+        Every chunk overlapping that range has been drawn onto its own surface by the render cache,
+        so we only blit those few chunk surfaces instead of every tile in view."""
+        tile_size = self.tile_size
+        self.render_cache.render(surf, offset,
+                                 (offset[0] // tile_size) >> CHUNK_SHIFT,
+                                 ((offset[0] + surf.get_width()) // tile_size) >> CHUNK_SHIFT,
+                                 (offset[1] // tile_size) >> CHUNK_SHIFT,
+                                 ((offset[1] + surf.get_height()) // tile_size) >> CHUNK_SHIFT)
@@ -0,0 +1,67 @@
+import pygame
+
+# the color of the hole the level is seen through, it's the colorkey of the masks
+HOLE_COLOR = (255, 255, 255)
+
+
+# the shapes a transition can open up with: draw the hole, size (how far it reaches from the center) is in pixel
+# * 8 per step is what makes the hole grow to the size of the screen in 30 steps
+def draw_iris(surf, center, size):
+    pygame.draw.circle(surf, HOLE_COLOR, center, size)
+
+
+def draw_diamond(surf, center, size):
+    if size > 0:
+        pygame.draw.polygon(surf, HOLE_COLOR, [(center[0], center[1] - size), (center[0] + size, center[1]),
+                                               (center[0], center[1] + size), (center[0] - size, center[1])])
+
+
+def draw_box(surf, center, size):
+    if size > 0:
+        pygame.draw.rect(surf, HOLE_COLOR, (center[0] - size, center[1] - size, size * 2, size * 2))
+
+
+SHAPES = {
+    'iris': draw_iris,
+    'diamond': draw_diamond,
+    'box': draw_box,
+}
+
+# (shape, display size, steps) -> the masks of every step, made once and shared by every Transition
+mask_cache = {}
+
+
+class Transition:
+    """The black overlay of the level transition: at step 30 (and -30) the screen is black, at step 1 it's almost
+    all level, a hole of the given shape in the middle grows by 8 pixels per step.
+    The mask of every step is drawn once when the first Transition of a shape and display size is made, with its
+    hole as the colorkey (RLEACCEL, a mask is big runs of black and of hole, that blits a lot faster), so during the
+    game a transition frame is one blit and doesn't make a single surface."""
+
+    def __init__(self, size, shape='iris', steps=30):
+        self.size = size
+        self.shape = shape
+        self.steps = steps
+        key = (shape, tuple(size), steps)
+        if key not in mask_cache:
+            mask_cache[key] = self.make_masks()
+        self.masks = mask_cache[key]
+
+    # masks[step - 1] is the mask of step (and -step)
+    def make_masks(self):
+        draw = SHAPES[self.shape]
+        center = (self.size[0] // 2, self.size[1] // 2)
+        masks = []
+        for step in range(1, self.steps + 1):
+            # a black surface size of the display with the hole drawn on it
+            mask = pygame.Surface(self.size)
+            draw(mask, center, (self.steps - step) * 8)
+            # the hole's color is the transparent part, so we see the level through it
+            mask.set_colorkey(HOLE_COLOR, pygame.RLEACCEL)
+            masks.append(mask)
+        return masks
+
+    # draw the overlay of step onto surf, step 0 is no transition
+    def render(self, surf, step):
+        if step:
+            surf.blit(self.masks[min(abs(step), self.steps) - 1], (0, 0))
@@ -1,25 +1,70 @@
 import os
+from concurrent.futures import ThreadPoolExecutor
 
 import pygame
+
 # global variable represents path to folder contain the img
 BASE_IMG_PATH = 'PlatformerV2/data/images/'
 
+# pngs decoded ahead of time by preload_pngs, path -> Surface, each one is handed out once by decode_png
+decoded = {}
+
+
+# decode pngs on a few threads at once, returns path -> Surface (not converted yet, convert() needs the main thread)
+# pygame lets go of the GIL while SDL_image decodes, so the threads really run at the same time
+def decode_pngs(paths, workers=None):
+    paths = list(paths)
+    if len(paths) < 2:
+        return {path: pygame.image.load(path) for path in paths}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return dict(zip(paths, pool.map(pygame.image.load, paths)))
+
+
+# the image a png decodes to, not converted yet: from preload_pngs, else decoded right now
+def decode_png(path):
+    img = decoded.pop(path, None)
+    if img is None:
+        img = pygame.image.load(path)
+    return img
+
+
+# decode every png in paths all at once on a thread pool,
+# so the decode_png calls for them afterwards don't have to wait for one png after the other
+def preload_pngs(paths):
+    decoded.update(decode_pngs([path for path in paths if path not in decoded]))
+
+
+# every png of the folder at path (relative to BASE_IMG_PATH), in name order
+def image_files(path):
+    # sorted, because os.listdir gives the files in whatever order the file system keeps them in
+    # and the position of an image in the list is its variant number
+    return [path + '/' + img_name for img_name in sorted(os.listdir(BASE_IMG_PATH + path))]
+
 
 def load_image(path):
     # Using convert will make rendering more efficient
-    img = pygame.image.load(BASE_IMG_PATH + path).convert()
+    img = decode_png(BASE_IMG_PATH + path).convert()
     img.set_colorkey((0, 0, 0))  # transparency
     return img
 
 
+# the image mirrored in the X axis, so it faces the other way (the colorkey comes along)
+# flipping makes a new surface, so do it once when loading and not every frame
+def flip_image(img):
+    return pygame.transform.flip(img, True, False)
+
+
 def load_images(path):
     # empty list to store all downloaded images
     images = []
+    img_paths = image_files(path)
+    # decode the pngs all at once on a thread pool, instead of one after the other
+    preload_pngs([BASE_IMG_PATH + img_path for img_path in img_paths])
     # loop to scan every file in the folder given by object 'path'
     # 'data/images/ ' + path
-    for img_name in os.listdir(BASE_IMG_PATH + path):
+    for img_path in img_paths:
         # using load_image function to load image and then add it to images list
-        images.append(load_image(path + '/' + img_name))
+        images.append(load_image(img_path))
     return images
 
 class Animation:
@@ -34,16 +79,20 @@ class Animation:
     self.loop: Stores whether the animation should loop.
     self.img_duration: Stores the duration each image should be displayed.
     self.done: A boolean flag indicating whether the animation has finished playing.
-    self.frame: Stores the current frame of the animation."""
-    def __init__(self, images, img_dur=5, loop=True):
+    self.frame: Stores the current frame of the animation.
+    self.flipped_images: The same images facing the other way, made once and shared by every copy."""
+    def __init__(self, images, img_dur=5, loop=True, flipped_images=None):
         self.images = images
+        if flipped_images is None:
+            flipped_images = [flip_image(img) for img in images]
+        self.flipped_images = flipped_images
         self.loop = loop
         self.img_duration = img_dur
         self.done = False
         self.frame = 0
 
     def copy(self):
-        return Animation(self.images, self.img_duration, self.loop)
+        return Animation(self.images, self.img_duration, self.loop, self.flipped_images)
 
     """Updates the animation by advancing the frame.
         If loop is True, the frame index wraps around to the beginning when reaching the end of the animation sequence.
@@ -59,7 +108,9 @@ class Animation:
     """Returns the image corresponding to the current frame of the animation.
     Calculates the index of the current frame based on the current frame number (self.frame) 
     and the image duration (self.img_duration).
-    Returns the corresponding image from the images list."""
-    def img(self):
+    Returns the corresponding image from the images list, or from flipped_images if flip is True."""
+    def img(self, flip=False):
+        if flip:
+            return self.flipped_images[int(self.frame / self.img_duration)]
         return self.images[int(self.frame / self.img_duration)]
 